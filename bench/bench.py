@@ -0,0 +1,184 @@
+#!/usr/bin/python3 -u
+
+usage="""bench - benchmark the converters against synthetic inputs
+
+Generates inputs with gen.py, runs each converter on them in a child
+process, and writes rows/s, triples/s and peak RSS per dataset as JSON,
+for comparison across commits.
+
+Usage:  bench [options] [dataset ...]
+Arguments:
+
+	dataset		one of cew-annual, cew-quarterly, lau, oes, geonames, sf1 (default: all)
+	-o output	output JSON file (default: stdout)
+	-n rows		number of data rows per dataset (default: 10000)
+	-g cities	number of LAU cities in the geography (default: 200)
+	-r seed		random seed (default: 0)
+	-k dir		generate inputs into dir and keep them
+	-a args		converter arguments (default: -s)
+	-d			enable debugging
+"""
+
+import getopt
+import sys
+import os
+import logging
+import json
+import time
+import tempfile
+import subprocess
+import shlex
+import platform
+
+sys.path.append(os.path.dirname(__file__))
+import gen
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+##
+# The converter script for each dataset.
+#
+scripts = {
+	'cew-annual': 'bls-cew/cew2rdf.py',
+	'cew-quarterly': 'bls-cew/cew2rdf.py',
+	'lau': 'bls-lau/lau2rdf.py',
+	'oes': 'bls-oes/oes2rdf.py',
+	'geonames': 'geonames/geonames2rdf.py',
+	'sf1': 'census-sf1/sf1rdf.py',
+}
+
+##
+# Driver function. Generate inputs, run the benchmarks, write the report.
+#
+def main():
+	outf = sys.stdout
+	rows = 10000
+	cities = 200
+	seed = 0
+	keepdn = None
+	convargs = ['-s']
+	debuglvl = logging.INFO
+
+	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:n:g:r:k:a:d')
+	except getopt.GetoptError as e:
+		logging.fatal('Getopt error {}'.format(e))
+		return 1
+
+	for opt, arg in opts:
+		if opt in {'-o', '--output'}:
+			outf = arg
+		elif opt in {'-n', '--rows'}:
+			rows = int(arg)
+		elif opt in {'-g', '--cities'}:
+			cities = int(arg)
+		elif opt in {'-r', '--seed'}:
+			seed = int(arg)
+		elif opt in {'-k', '--keep'}:
+			keepdn = arg
+		elif opt in {'-a', '--args'}:
+			convargs = shlex.split(arg)
+		elif opt in {'-d', '--debug'}:
+			debuglvl = logging.DEBUG
+		elif opt in {'-h', '--help'}:
+			print(usage, file=sys.stderr)
+			return 0
+		else:
+			logging.fatal('Invalid flag {}'.format(opt))
+			print(usage, file=sys.stderr)
+			return 1
+
+	names = args or list(scripts)
+	for name in names:
+		if name not in scripts:
+			logging.fatal('Unknown dataset {}'.format(name))
+			return 1
+
+	logging.getLogger().setLevel(debuglvl)
+
+	with tempfile.TemporaryDirectory() as tmpdn:
+		indn = keepdn or tmpdn
+		logging.info("Generating inputs in {}".format(indn))
+		counts = gen.generate(indn, rows, cities, seed)
+
+		results = {}
+		for name in names:
+			logging.info("Running {}".format(name))
+			inputs = [os.path.join(indn, fn) for fn in gen.files[name]]
+			results[name] = run(scripts[name], convargs, inputs, counts[name], tmpdn)
+			logging.info("{rows_per_s:.0f} rows/s, {triples_per_s:.0f} triples/s, {max_rss_kb} kB".format(**results[name]))
+
+	report = {
+		'commit': commit(),
+		'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+		'python': platform.python_version(),
+		'rows': rows,
+		'cities': cities,
+		'seed': seed,
+		'args': convargs,
+		'results': results,
+	}
+	if isinstance(outf, str):
+		with open(outf, 'w') as f:
+			json.dump(report, f, indent='\t', sort_keys=True)
+	else:
+		json.dump(report, outf, indent='\t', sort_keys=True)
+		print(file=outf)
+
+##
+# Run a converter in a child process, writing N-Triples, and measure it.
+#
+# @input script: The converter script, relative to the repository root.
+# @input convargs: The converter options.
+# @input inputs: The converter input filenames.
+# @input rows: The number of data rows in the inputs.
+# @input tmpdn: A directory for the output.
+# @return: A dictionary of measurements.
+#
+def run(script, convargs, inputs, rows, tmpdn):
+	outfn = os.path.join(tmpdn, 'out.nt')
+	errfn = os.path.join(tmpdn, 'err.txt')
+	cmd = [sys.executable, os.path.join(root, script)] + convargs + ['-f', 'nt', '-o', outfn] + inputs
+	logging.debug("Running {}".format(' '.join(cmd)))
+
+	with open(errfn, 'wb') as errf:
+		start = time.perf_counter()
+		proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=errf)
+		pid,status,rusage = os.wait4(proc.pid, 0)
+		secs = time.perf_counter() - start
+	proc.returncode = os.waitstatus_to_exitcode(status)
+	if proc.returncode != 0:
+		with open(errfn) as errf:
+			logging.warning("{} failed: {}".format(script, errf.read()[-2000:]))
+
+	triples = 0
+	if os.path.exists(outfn):
+		with open(outfn, 'rb') as f:
+			for block in iter(lambda: f.read(1<<20), b''):
+				triples += block.count(b'\n')
+		os.remove(outfn)
+
+	return {
+		'status': proc.returncode,
+		'rows': rows,
+		'triples': triples,
+		'seconds': secs,
+		'cpu_seconds': rusage.ru_utime + rusage.ru_stime,
+		'rows_per_s': rows / secs,
+		'triples_per_s': triples / secs,
+		'max_rss_kb': rusage.ru_maxrss,
+	}
+
+##
+# Return the current git commit, or None.
+#
+def commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,348 @@
+#!/usr/bin/python3 -u
+
+usage="""gen - generate synthetic converter inputs for benchmarking
+
+Writes seeded, self-consistent fakes of the BLS CEW, LAU and OES files, the
+BGN GOVT_UNITS and NationalFedCodes files, and a Census SF1 zip, so that
+each converter resolves most areas and runs its full code path.
+
+Usage:  gen [options] outdir
+Arguments:
+
+	-n rows		number of data rows per dataset (default: 10000)
+	-g cities	number of LAU cities in the geography (default: 200)
+	-r seed		random seed (default: 0)
+	-d			enable debugging
+"""
+
+import getopt
+import sys
+import os
+import logging
+import random
+import zipfile
+
+##
+# Driver function. Generate every input into the output directory.
+#
+def main():
+	rows = 10000
+	cities = 200
+	seed = 0
+	debuglvl = logging.INFO
+
+	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'hn:g:r:d')
+	except getopt.GetoptError as e:
+		logging.fatal('Getopt error {}'.format(e))
+		return 1
+
+	for opt, arg in opts:
+		if opt in {'-n', '--rows'}:
+			rows = int(arg)
+		elif opt in {'-g', '--cities'}:
+			cities = int(arg)
+		elif opt in {'-r', '--seed'}:
+			seed = int(arg)
+		elif opt in {'-d', '--debug'}:
+			debuglvl = logging.DEBUG
+		elif opt in {'-h', '--help'}:
+			print(usage, file=sys.stderr)
+			return 0
+		else:
+			logging.fatal('Invalid flag {}'.format(opt))
+			print(usage, file=sys.stderr)
+			return 1
+	if len(args) < 1:
+		logging.fatal('Need output directory')
+		print(usage, file=sys.stderr)
+		return 1
+
+	logging.getLogger().setLevel(debuglvl)
+	generate(args[0], rows, cities, seed)
+
+##
+# The input files written by generate(), by dataset.
+#
+files = {
+	'cew-annual': ['cew.annual.singlefile.csv', 'GOVT_UNITS.txt'],
+	'cew-quarterly': ['cew.q.singlefile.csv', 'GOVT_UNITS.txt'],
+	'lau': ['la.data.0.CurrentU', 'la.area', 'laucnty.txt', 'GOVT_UNITS.txt', 'NationalFedCodes.txt'],
+	'oes': ['oe.data.0.Current', 'oe.industry', 'GOVT_UNITS.txt'],
+	'geonames': ['GOVT_UNITS.txt', 'NationalFedCodes.txt'],
+	'sf1': ['xx2010.sf1.zip'],
+}
+
+##
+# Generate every input into a directory.
+#
+# @input outdn: The output directory, created if needed.
+# @input rows: The number of data rows per dataset.
+# @input cities: The number of LAU cities in the geography.
+# @input seed: The random seed.
+# @return: A dictionary of dataset name => data rows written.
+#
+def generate(outdn, rows, cities, seed):
+	os.makedirs(outdn, exist_ok=True)
+	rng = random.Random(seed)
+	geo = Geography(rng, cities)
+	path = lambda fn: os.path.join(outdn, fn)
+	counts = {}
+
+	logging.info("Generating BGN files")
+	with open(path('GOVT_UNITS.txt'), 'w') as f:
+		geo.write_govunits(f)
+	with open(path('NationalFedCodes.txt'), 'w') as f:
+		counts['geonames'] = geo.write_fedcodes(f, rng, rows)
+
+	logging.info("Generating CEW files")
+	with open(path('cew.annual.singlefile.csv'), 'w') as f:
+		counts['cew-annual'] = write_cew(f, geo, rng, rows, False)
+	with open(path('cew.q.singlefile.csv'), 'w') as f:
+		counts['cew-quarterly'] = write_cew(f, geo, rng, rows, True)
+
+	logging.info("Generating LAU files")
+	with open(path('la.area'), 'w') as f:
+		geo.write_laarea(f)
+	with open(path('laucnty.txt'), 'w') as f:
+		geo.write_laucnty(f)
+	with open(path('la.data.0.CurrentU'), 'w') as f:
+		counts['lau'] = write_ladata(f, geo, rng, rows)
+
+	logging.info("Generating OES files")
+	with open(path('oe.industry'), 'w') as f:
+		write_oeindustry(f)
+	with open(path('oe.data.0.Current'), 'w') as f:
+		counts['oes'] = write_oedata(f, geo, rng, rows)
+
+	logging.info("Generating SF1 file")
+	counts['sf1'] = write_sf1(path('xx2010.sf1.zip'), geo, rng, rows)
+
+	return counts
+
+##
+# A fake geography of states, counties and cities with GNIS IDs, shared
+# by all the generated files so lookups between them resolve.
+#
+class Geography:
+	states = [('01','AL','Alabama'), ('04','AZ','Arizona'), ('06','CA','California'),
+		('08','CO','Colorado'), ('12','FL','Florida'), ('17','IL','Illinois'),
+		('26','MI','Michigan'), ('36','NY','New York'), ('48','TX','Texas'),
+		('53','WA','Washington')]
+	kinds = [('city','City of {}','C1'), ('town','Town of {}','T1'),
+		('village','Village of {}','C5'), ('township','Township of {}','T1'),
+		('borough','Borough of {}','C1')]
+
+	##
+	# @input rng: A random.Random.
+	# @input cities: The number of cities.
+	#
+	def __init__(self, rng, cities):
+		self.gnis = 1000000
+		self.state_gnis = {}
+		self.counties = [] # (state, county, gnis)
+		self.cities = [] # (state, county, gnis, name, kind)
+		for state,alpha,name in self.states:
+			self.state_gnis[state] = self.next_gnis()
+			for county in range(1, 2*rng.randint(10, 40), 2):
+				self.counties.append((state, '{:03d}'.format(county), self.next_gnis()))
+		for i in range(cities):
+			state,county,_ = rng.choice(self.counties)
+			kind = rng.choice(self.kinds)
+			self.cities.append((state, county, self.next_gnis(), 'Place{}'.format(i), kind))
+
+	def next_gnis(self):
+		self.gnis += 1
+		return str(self.gnis)
+
+	def alpha(self, state):
+		return next(a for s,a,n in self.states if s == state)
+
+	##
+	# Write the BGN "Government Units" file.
+	#
+	def write_govunits(self, f):
+		f.write('FEATURE_ID|UNIT_TYPE|COUNTY_NUMERIC|COUNTY_NAME|STATE_NUMERIC|STATE_ALPHA|STATE_NAME|COUNTRY_ALPHA|COUNTRY_NAME|FEATURE_NAME\n')
+		for state,alpha,name in self.states:
+			f.write('|'.join([self.state_gnis[state], 'STATE', '', '', state, alpha, name, 'US', 'United States', 'State of '+name])+'\n')
+		for state,county,gnis in self.counties:
+			cname = 'County{}'.format(county)
+			f.write('|'.join([gnis, 'COUNTY', county, cname, state, self.alpha(state), '', 'US', 'United States', cname+' County'])+'\n')
+
+	##
+	# Write the BGN NationalFedCodes file: the counties and cities, padded
+	# with other features to the given number of rows.
+	#
+	def write_fedcodes(self, f, rng, rows):
+		f.write('FEATURE_ID|FEATURE_NAME|FEATURE_CLASS|CENSUS_CODE|CENSUS_CLASS_CODE|GSA_CODE|OPM_CODE|STATE_NUMERIC|STATE_ALPHA|COUNTY_SEQUENCE|COUNTY_NUMERIC|COUNTY_NAME|PRIMARY_LATITUDE|PRIMARY_LONGITUDE|DATE_CREATED|DATE_EDITED\n')
+		fields = lambda gnis,name,cls,census,state,county: [gnis, name, cls, census, cls and census and rng.choice(['C1','T1','Z1']) or '', '', '', state, self.alpha(state), '1', county, 'County{}'.format(county), '38.0', '-121.0', '', '']
+		n = 0
+		for state,county,gnis in self.counties:
+			f.write('|'.join([gnis, 'County{} County'.format(county), 'Civil', '', 'H1', '', '', state, self.alpha(state), '1', county, 'County{}'.format(county), '38.0', '-121.0', '', ''])+'\n')
+			n += 1
+		for state,county,gnis,name,(suffix,full,cls) in self.cities:
+			f.write('|'.join([gnis, full.format(name), 'Civil', '{:05d}'.format(int(gnis) % 100000), cls, '', '', state, self.alpha(state), '1', county, 'County{}'.format(county), '38.0', '-121.0', '', ''])+'\n')
+			n += 1
+		while n < rows:
+			state,county,_ = rng.choice(self.counties)
+			cls = rng.choice(['Populated Place', 'Census', 'Stream', 'Summit', 'School'])
+			census = cls in {'Populated Place', 'Census'} and '{:05d}'.format(rng.randrange(100000)) or ''
+			f.write('|'.join(fields(self.next_gnis(), 'Feature{}'.format(n), cls, census, state, county))+'\n')
+			n += 1
+		return n
+
+	##
+	# Write the LAU <la.area> file: states (unmapped), counties and cities.
+	#
+	def write_laarea(self, f):
+		f.write('area_type_code\tarea_code\tarea_text\tdisplay_level\tselectable\tsort_sequence\n')
+		for state,alpha,name in self.states:
+			f.write('A\tST{}00000000000\t{}\t0\tT\t1\n'.format(state, name))
+		for state,county,gnis in self.counties:
+			f.write('F\t{}\tCounty{} County, {}\t1\tT\t1\n'.format(self.county_area(state, county), county, self.alpha(state)))
+		for i,(state,county,gnis,name,(suffix,full,cls)) in enumerate(self.cities):
+			f.write('G\t{}\t{} {}, {}\t2\tT\t1\n'.format(self.city_area(state, i), name, suffix, self.alpha(state)))
+
+	##
+	# Write the LAU yearly county data file.
+	#
+	def write_laucnty(self, f):
+		for i in range(6):
+			f.write('header\n')
+		for state,county,gnis in self.counties:
+			f.write('{:15}   {}     {}   County{} County, {}   2016\n'.format(self.county_area(state, county), state, county, county, self.alpha(state)))
+		f.write('\nfootnotes\n')
+
+	##
+	# Return all LAU area codes, including unmapped ones.
+	#
+	def lau_areas(self):
+		areas = ['ST{}00000000000'.format(state) for state,alpha,name in self.states]
+		areas += [self.county_area(state, county) for state,county,gnis in self.counties]
+		areas += [self.city_area(city[0], i) for i,city in enumerate(self.cities)]
+		return areas
+
+	@staticmethod
+	def county_area(state, county):
+		return 'CN{}{}00000000'.format(state, county)
+
+	@staticmethod
+	def city_area(state, i):
+		return 'CT{}{:07d}0000'.format(state, i)
+
+##
+# Write a CEW singlefile, annual (38 columns) or quarterly (42 columns).
+#
+def write_cew(f, geo, rng, rows, quarterly):
+	ncols = 42 if quarterly else 38
+	f.write(','.join('"col{}"'.format(i) for i in range(ncols))+'\n')
+	industries = ['10', '101', '1011', '1012', '102', '11', '21', '23', '31-33', '44-45', '48-49', '52', '5221', '62']
+	special = ['US000', 'USCMS', 'USMSA', 'USNMS', 'C1018', 'C1218', 'C3108', 'CS122', 'CS348']
+	for n in range(rows):
+		r = rng.random()
+		if r < 0.05:
+			area = rng.choice(special)
+		elif r < 0.15:
+			area = rng.choice(geo.states)[0] + rng.choice(['000', '999'])
+		else:
+			state,county,_ = rng.choice(geo.counties)
+			area = state + county
+		year = str(rng.randint(2001, 2016))
+		disclosure = 'N' if rng.random() < 0.2 else ''
+		key = [area, str(rng.randint(0, 5)), rng.choice(industries), str(rng.randint(10, 78)), '0', year,
+			str(rng.randint(1, 4)) if quarterly else 'A', disclosure]
+		nums = [str(rng.randint(0, 100000)) for i in range(ncols - len(key))]
+		f.write(','.join('"{}"'.format(k) for k in key) + ',' + ','.join(nums) + '\n')
+	return rows
+
+##
+# Write a LAU <la.data.*> file, cycling through series, years and months.
+#
+def write_ladata(f, geo, rng, rows):
+	f.write('series_id                     \tyear\tperiod\t       value\tfootnote_codes\n')
+	areas = geo.lau_areas()
+	n = 0
+	while n < rows:
+		sid = 'LA' + rng.choice('SU') + rng.choice(areas) + rng.choice(['03', '04', '05', '06'])
+		for year in range(rng.randint(1990, 2010), 2017):
+			for month in range(1, 14):
+				if n >= rows:
+					return n
+				if rng.random() < 0.01:
+					value = '-'
+				elif sid[-2:] == '03':
+					value = '{:.1f}'.format(rng.uniform(1, 15))
+				else:
+					value = str(rng.randint(100, 5000000))
+				f.write('{:<30}\t{}\tM{:02d}\t{:>12}\t\n'.format(sid, year, month, value))
+				n += 1
+	return n
+
+##
+# OES industry codes, as (code, display level).
+#
+oes_industries = [('000000', 0), ('000001', 0), ('31-330', 2), ('44-450', 2), ('48-490', 2),
+	('110000', 2), ('113300', 4), ('211000', 3), ('523000', 3), ('541100', 4), ('621100', 4)]
+
+##
+# Write the OES <oe.industry> file.
+#
+def write_oeindustry(f):
+	f.write('industry_code\tindustry_name\tdisplay_level\tselectable\tsort_sequence\n')
+	for i,(code,lvl) in enumerate(oes_industries, 1):
+		f.write('{}\tIndustry {}\t{}\tT\t{}\n'.format(code, code, lvl, i))
+
+##
+# Write an OES <oe.data.*> file.
+#
+def write_oedata(f, geo, rng, rows):
+	f.write('series_id                    \tyear\tperiod\t       value\tfootnote_codes\n')
+	for n in range(rows):
+		r = rng.random()
+		if r < 0.1:
+			areatype,area = 'N','0000000'
+		elif r < 0.5:
+			areatype,area = 'S',rng.choice(geo.states)[0]+'00000'
+		elif r < 0.9:
+			areatype,area = 'M','00'+rng.choice(['10180', '12180', '31080', '41860'])
+		else:
+			areatype,area = 'M',rng.choice(geo.states)[0]+'12345'
+		datatype = rng.choice(['01', '02', '03', '04', '05', '08', '13'])
+		sid = 'OEU' + areatype + area + rng.choice(oes_industries)[0] + '{:06d}'.format(rng.randrange(0, 540000, 10)) + datatype
+		year = '2016' if rng.random() < 0.9 else '2015'
+		value = '{:.1f}'.format(rng.uniform(0, 50)) if datatype in {'02', '05'} else str(rng.randint(30, 250000))
+		f.write('{}\t{}\tA01\t{:>12}\t\n'.format(sid, year, value))
+	return rows
+
+##
+# Write a Census SF1 zip with a geographic header file and segment 4.
+#
+def write_sf1(fn, geo, rng, rows):
+	geol = []
+	segl = []
+	for n in range(1, rows+1):
+		line = [' '] * 500
+		def put(pos, s):
+			line[pos:pos+len(s)] = s
+		sumlev = rng.choice(['040', '050', '050', '050', '310', '330', '060', '140'])
+		state,county,gnis = rng.choice(geo.counties)
+		put(0, 'SF1STXX')
+		put(8, sumlev)
+		put(11, '00' if rng.random() < 0.9 else '01')
+		put(18, '{:07d}'.format(n))
+		put(112, '{:05d}'.format(rng.randrange(10000, 50000)))
+		put(124, '{:03d}'.format(rng.randrange(100, 600)))
+		put(318, '{:9d}'.format(rng.randint(0, 1000000)))
+		put(373, '{:08d}'.format(int(geo.state_gnis[state])))
+		put(381, '{:08d}'.format(int(gnis)))
+		geol.append(''.join(line).rstrip() + '\n')
+		segl.append(','.join(['SF1ST', 'XX', '000', '04', '{:07d}'.format(n)] + [str(rng.randint(0, 100000)) for i in range(4+71+73+49)]) + '\n')
+	with zipfile.ZipFile(fn, 'w', zipfile.ZIP_DEFLATED) as zipf:
+		zipf.writestr('xxgeo2010.sf1', ''.join(geol))
+		zipf.writestr('xx000042010.sf1', ''.join(segl))
+	return rows
+
+if __name__ == '__main__':
+	main()
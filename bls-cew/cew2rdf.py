@@ -5,12 +5,47 @@ usage="""cew2rdf - convert the US BLS Census of Employment and Wages dataset int
 See <https://www.bls.gov/cew/>. Requires python3, python3-rdfllib and 
 python3-bsddb3.
 
-Usage:  cew2rdf [options] *.singlefile.csv GOVT_UNITS_*.txt
+Inputs may be compressed as .gz, .bz2, .xz, .zst or single-file .zip,
+and the output as .gz, .bz2, .xz or .zst, by filename extension.
+
+Given several singlefiles, or directories of them, converts each into its
+own file in the output directory, named for the singlefile with the
+extension of the output format, and sums up the metrics.
+
+Usage:  cew2rdf [options] *.singlefile.csv|dir ... GOVT_UNITS_*.txt
 Arguments:
 
-	-o output	output file (default: stdout)
+	-o output	output file (default: stdout), or directory for several singlefiles
 	-d			enable debugging
-	-f fmt		use format for output file (default: turtle)
+	-f fmt		use format for output file (default: turtle; rdfbin and nt-sorted imply -s)
+	-s			stream triples to output as they are produced (nt, nt-sorted, turtle or rdfbin)
+	-b store	add to the persistent store directory, then save all of it
+	-j n		convert using n worker processes (implies -s); with several
+			singlefiles, convert n of them at a time
+	-m file		write a JSON metrics report to file
+	-u mb		drop repeated streamed triples, using up to mb MB of memory
+			(nt-sorted always drops them, and sorts in mb MB; default: 256)
+	-C dir		cache parsed reference files like GOVT_UNITS_*.txt in dir
+	-p			read the singlefile in chunks of columns with python3-pandas,
+			filtering out undisclosed and other ownership rows a chunk at a time
+	-A areas	only convert areas whose codes start with one of the comma-separated
+			prefixes, e.g., 06 for California
+	-O owners	only convert the comma-separated ownership codes
+	-L levels	only convert the comma-separated aggregation level codes
+	-I inds		only convert industries whose codes start with one of the
+			comma-separated prefixes
+	-Y years	only convert the year or range of years, as 2010, 2010-2016,
+			2010- for 2010 on, or -2016 for up to 2016
+	-S			group the observations of each series into a qb:Slice, which has
+			their shared area, industry and ownership, instead of each
+			observation; in annual files, a slice per series and year also
+			has the frequency and year. A slice costs about as many triples
+			as it saves per observation, so it pays off as each holds at
+			least 2, for about a quarter fewer triples
+	-D manifest	delta mode: write only observations added or changed since the run
+			that wrote manifest, then update it (implies -s; needs -f nt)
+	-r file		with -D, write SPARQL deletes of changed and removed observations
+			to file (default: manifest.delete.ru)
 """
 
 import rdflib
@@ -19,12 +54,20 @@ import csv
 import sys
 import logging
 import itertools
+import io
+try:
+	import pandas
+	import numpy
+except ImportError:
+	pandas = None
 
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'geonames'))
 from geonames2rdf import FIPS2GNISDict
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
-from stats import StatsGraph
+from stats import StatsGraph, LineFilter, output_files, BinarySink, SortedSink, DeltaSink, Dedup, stream_sink, stream_formats, StoreSink, Slot, metrics
+from fileio import input_files, open_input
+from refcache import refcache
 
 ##
 # Driver function. Create FIPS-to-GNISID map, then create RDF data cube graph,
@@ -33,12 +76,21 @@ from stats import StatsGraph
 def main():
 	outf = sys.stdout.buffer
 	outfmt = 'turtle'
+	stream = False
+	storedn = None
+	dedup = None
+	jobs = 1
+	manifestfn = None
+	deletefn = None
+	columnar = False
+	select = LineFilter(',')
+	slices = False
 	debuglvl = logging.INFO
 
 	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:')
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:sb:j:m:u:C:D:r:pA:O:L:I:Y:S')
 	except getopt.GetoptError as e:
 		logging.fatal('Getopt error {}'.format(e))
 		return 1
@@ -51,6 +103,43 @@ def main():
 		elif opt in {'-f', '--format'}:
 			# XXX verify, otherwise die and inform of valid input
 			outfmt = arg
+			stream = stream or outfmt in BinarySink.formats | SortedSink.formats
+		elif opt in {'-s', '--stream'}:
+			stream = True
+		elif opt in {'-b', '--store'}:
+			storedn = arg
+		elif opt in {'-u', '--unique'}:
+			dedup = int(arg) << 20
+		elif opt in {'-m', '--metrics'}:
+			metrics.enable(arg)
+		elif opt in {'-C', '--cache'}:
+			refcache.enable(arg)
+		elif opt in {'-j', '--jobs'}:
+			jobs = int(arg)
+			stream = stream or jobs > 1
+		elif opt in {'-D', '--delta'}:
+			manifestfn = arg
+			stream = True
+		elif opt in {'-r', '--deletes'}:
+			deletefn = arg
+		elif opt in {'-p', '--columnar'}:
+			columnar = True
+		elif opt in {'-A', '--areas'}:
+			select.prefix(0, arg.split(','))
+		elif opt in {'-O', '--owners'}:
+			select.values(1, arg.split(','))
+		elif opt in {'-L', '--levels'}:
+			select.values(3, arg.split(','))
+		elif opt in {'-I', '--industries'}:
+			select.prefix(2, arg.split(','))
+		elif opt in {'-Y', '--years'}:
+			try:
+				select.span(5, arg)
+			except ValueError as e:
+				logging.fatal(e)
+				return 1
+		elif opt in {'-S', '--slices'}:
+			slices = True
 		elif opt in {'-h', '--help'}:
 			print(usage, file=sys.stderr)
 			return 0
@@ -63,21 +152,96 @@ def main():
 		print(usage, file=sys.stderr)
 		return 1
 
+	if stream and outfmt not in stream_formats:
+		logging.fatal('Cannot stream format {}'.format(outfmt))
+		return 1
+	if stream and storedn:
+		logging.fatal('Cannot both stream and use a store')
+		return 1
+	if manifestfn and outfmt not in DeltaSink.formats:
+		logging.fatal('Cannot write format {} in delta mode'.format(outfmt))
+		return 1
+	if columnar and pandas is None:
+		logging.fatal('Need the pandas module to read in columns')
+		return 1
+
+	singlefns = input_files(args[:-1], '*singlefile*') # *.singlefile.csv
+	govfn = args[-1] # GOVT_UNITS_*.txt
+	batch = len(singlefns) != 1 or os.path.isdir(args[0])
+	if batch and not isinstance(outf, str):
+		logging.fatal('Need an output directory for several singlefiles')
+		return 1
+	if batch and (manifestfn or storedn):
+		logging.fatal('Cannot use delta mode or a store with several singlefiles')
+		return 1
+
 	logging.getLogger().setLevel(debuglvl)
-	singlefn = args[0] # *.singlefile.csv
-	govfn = args[1] # GOVT_UNITS_*.txt
 
-	logging.info("Building FIPSMap")
-	with open(govfn) as f:
-		m = FIPS2GNISDict(f)
+	if batch:
+		try:
+			outfns = output_files(singlefns, outf, outfmt)
+		except ValueError as e:
+			logging.fatal(e)
+			return 1
+
+	with metrics.stage("Building FIPSMap"):
+		m = AreaDict(FIPS2GNISDict(govfn))
+
+	if batch:
+		os.makedirs(outf, exist_ok=True)
+		with metrics.stage("Building RDF"):
+			CEWGraph.convert_batch(singlefns, outfns, jobs, outfmt, stream, 'convert_cew', m, columnar, select, slices, dedup=dedup)
+		return 0
 
-	logging.info("Building RDF")
-	with open(singlefn) as f:
-		g = CEWGraph()
-		g.convert_cew(f, m)
+	singlefn = singlefns[0]
+	sink = None
+	if manifestfn:
+		sink = DeltaSink(outf, manifestfn, deletefn or manifestfn + '.delete.ru', Dedup(dedup) if dedup else None)
+	elif stream and jobs == 1:
+		sink = stream_sink(outf, outfmt, dedup)
+	elif storedn:
+		sink = StoreSink(storedn)
 
-	logging.info("Saving RDF")
-	g.serialize(outf, format=outfmt)
+	if jobs > 1:
+		with metrics.stage("Building RDF"):
+			CEWGraph.convert_sharded(singlefn, jobs, outf, outfmt, 'convert_cew', m, columnar, select, slices, sink=sink, dedup=dedup)
+		return 0
+
+	with metrics.stage("Building RDF"), open_input(singlefn) as f:
+		g = CEWGraph(sink)
+		g.convert_cew(f, m, columnar, select, slices)
+
+	with metrics.stage("Saving RDF"):
+		g.serialize(outf, format=outfmt)
+
+##
+# Map CEW area codes to area URLs, decoding each code once. The state and
+# county codes are decoded up front, so worker processes share them; other
+# codes as they are first looked up. Codes with unknown FIPS IDs map to
+# None, and are logged once each.
+#
+class AreaDict(dict):
+	##
+	# @input m: The dictionary that maps FIPS IDs to GNIS IDs.
+	#
+	def __init__(self, m):
+		super().__init__()
+		self.m = m
+		for state,county in m:
+			if county is None:
+				for code in (state+'000', state+'999'):
+					self[code] = CEWGraph.decode_area2gnis(code, m)
+			else:
+				self[state+county] = CEWGraph.decode_area2gnis(state+county, m)
+
+	def __missing__(self, code):
+		try:
+			area = CEWGraph.decode_area2gnis(code, self.m)
+		except KeyError:
+			logging.warning("Unknown area code {}".format(code))
+			area = None
+		self[code] = area
+		return area
 
 ##
 #
@@ -92,12 +256,57 @@ class CEWGraph(StatsGraph):
 	#cew_cur = rdflib.Literal('USD', datatype=rdflib.XSD.string) # ISO 4217
 	cew_people = ont_cew['people'] # rdfs:subPropertyOf sdmx-measure:obsValue
 
+	# rows per chunk when reading in columns
+	chunk = 100000
+	# the columns used, when reading in columns
+	acew_cols = [0, 1, 2, 5, 6, 7, 9, 14]
+	qcew_cols = [0, 1, 2, 5, 6, 7, 9, 10, 11, 15]
+
 	##
 	#
 	#
-	def __init__(self):
-		super().__init__()
+	def __init__(self, sink=None):
+		super().__init__(sink)
 		self.g.bind('cew-ont', self.ont_cew)
+		self.emplvla = self.observation(self.cew_emplvl, self.sdmx_freqa, self.cew_people, rdflib.XSD.nonNegativeInteger)
+		self.avgapay = self.observation(self.cew_avgapay, self.sdmx_freqa, self.sdmx_cur, rdflib.XSD.nonNegativeInteger)
+		self.emplvlm = self.observation(self.cew_emplvl, self.sdmx_freqm, self.cew_people, rdflib.XSD.nonNegativeInteger)
+		self.avgwwage = self.observation(self.cew_avgwwage, self.sdmx_freqq, self.sdmx_cur, rdflib.XSD.integer)
+		# with slices, the observations only have what they do not share
+		self.slices = False
+		self.aslice = self.slice_template((self.sdmx_area, Slot()), (self.cew_ind, Slot()), (self.cew_own, Slot()), (self.sdmx_freq, self.sdmx_freqa), (self.sdmx_time, Slot()))
+		self.qslice = self.slice_template((self.sdmx_area, Slot()), (self.cew_ind, Slot()), (self.cew_own, Slot()))
+		self.emplvla_sl = self.sliced_observation(self.cew_emplvl, self.cew_people, rdflib.XSD.nonNegativeInteger)
+		self.avgapay_sl = self.sliced_observation(self.cew_avgapay, self.sdmx_cur, rdflib.XSD.nonNegativeInteger)
+		self.emplvlm_sl = self.sliced_observation(self.cew_emplvl, self.cew_people, rdflib.XSD.nonNegativeInteger, (self.sdmx_freq, self.sdmx_freqm), (self.sdmx_time, Slot()))
+		self.avgwwage_sl = self.sliced_observation(self.cew_avgwwage, self.sdmx_cur, rdflib.XSD.integer, (self.sdmx_freq, self.sdmx_freqq), (self.sdmx_time, Slot()))
+
+	##
+	# Return an observation template, filled in with the observation's
+	# area, industry, ownership, time period and measure value.
+	#
+	def observation(self, typ, freq, measure, datatype):
+		return self.template(
+			(rdflib.RDF.type, self.qb_obs),
+			(rdflib.RDF.type, typ),
+			(self.sdmx_area, Slot()),
+			(self.cew_ind, Slot()),
+			(self.cew_own, Slot()),
+			(self.sdmx_freq, freq),
+			(self.sdmx_time, Slot()),
+			(measure, Slot(datatype)))
+
+	##
+	# Return a template for an observation in a slice, filled in with the
+	# pairs' slots and the measure value. It has none of the dimensions
+	# the slice fixes, nor the type qb:Observation, which qb:observation
+	# and the type typ imply.
+	#
+	def sliced_observation(self, typ, measure, datatype, *pairs):
+		return self.template(
+			(rdflib.RDF.type, typ),
+			*pairs,
+			(measure, Slot(datatype)))
 
 	##
 	# Automatically choose the conversion function (between annual or
@@ -106,10 +315,26 @@ class CEWGraph(StatsGraph):
 	#
 	# TODO Throw exception and let driver function deal with it.
 	#
-	def convert_cew(self, f, m):
-		csv_reader = csv.reader(f, doublequote=False)
-		next(csv_reader)
-		peek = next(csv_reader)
+	# @input f: The singlefile, or an iterable of its lines.
+	# @input m: The AreaDict that maps CEW area codes to area URLs.
+	# @input header: Whether the lines start with the header.
+	# @input columnar: Whether to read in chunks of columns; see convert_columns().
+	# @input select: A LineFilter of the rows to convert, or None for all.
+	# @input slices: Whether to group observations into slices.
+	#
+	def convert_cew(self, f, m, columnar=False, select=None, slices=False, header=True):
+		self.slices = slices
+		lines = iter(f)
+		if header:
+			next(lines, None)
+		if select:
+			lines = select(lines)
+		if columnar:
+			return self.convert_columns(lines, m)
+		csv_reader = csv.reader(lines, doublequote=False)
+		peek = next(csv_reader, None)
+		if peek is None:
+			return
 		if len(peek) == 42:
 			logging.info("Assuming single quarterly file")
 			self.convert_qcew(itertools.chain([peek], csv_reader), m)
@@ -120,35 +345,86 @@ class CEWGraph(StatsGraph):
 			logging.info("Unable to determine filetype with length {}".format(len(peek)))
 			return 1
 
+	##
+	# Convert a singlefile like convert_cew(), but parse it a chunk of rows
+	# at a time into columns with pandas, keeping only the columns used, and
+	# drop undisclosed and other ownership rows a whole column at a time, so
+	# only the remaining rows are handled one by one.
+	#
+	# @input lines: An iterable of the singlefile lines, after the header.
+	# @input m: The AreaDict that maps CEW area codes to area URLs.
+	#
+	def convert_columns(self, lines, m):
+		n = 0
+		add = None
+		while True:
+			chunk = list(itertools.islice(lines, self.chunk))
+			if not chunk:
+				break
+			if add is None:
+				ncols = len(next(csv.reader(chunk[:1], doublequote=False)))
+				if ncols == 42:
+					logging.info("Assuming single quarterly file")
+					add,cols = self.add_qcew, self.qcew_cols
+				elif ncols == 38:
+					logging.info("Assuming single annual file")
+					add,cols = self.add_acew, self.acew_cols
+				else:
+					logging.info("Unable to determine filetype with length {}".format(ncols))
+					return 1
+			df = pandas.read_csv(io.StringIO(''.join(chunk)), header=None, usecols=cols, dtype=str, na_filter=False, doublequote=False)
+			n += len(df)
+			logging.debug("Processing {0}".format(n))
+
+			if add == self.add_acew:
+				assert (df[6] == 'A').all()
+			disclosed = df[7].to_numpy() != 'N'
+			owned = numpy.isin(df[1].to_numpy(), ('0','5'))
+			metrics.skip('disclosure', int((~disclosed).sum()))
+			metrics.skip('owner', int((disclosed & ~owned).sum()))
+
+			df = df[disclosed & owned]
+			if add == self.add_acew:
+				rows = zip(df[0], df[1], df[2], df[5], df[9], df[14])
+			else:
+				rows = zip(df[0], df[1], df[2], df[5], df[6], df[9], df[10], df[11], df[15])
+			for row in rows:
+				add(*row, m)
+
+		metrics.count('rows', n)
+
 	##
 	# Given the CEW area code, return the ID fragment and URL.
 	# See <https://data.bls.gov/cew/doc/titles/area/area_titles.htm>.
 	#
 	# TODO What exceptions are possible here?
 	#
+	# Rows look areas up in an AreaDict, which calls this once per code.
+	#
 	# @input code: The code representing the area.
 	# @input m: The dictionary that maps FIPS IDs to GNIS IDs.
-	# @return: The area URL (or ...?)
+	# @return: The area URL; raises KeyError for unknown FIPS IDs.
 	#
-	def decode_area2gnis(self, code, m):
+	@classmethod
+	def decode_area2gnis(cls, code, m):
 		assert code is not None and len(code) >= 5 and m is not None
 
 		if code[0:5] == 'US000':
-			area = self.id_gnis['1890467'] # TODO not sure, maybe use 0
+			area = cls.id_gnis['1890467'] # TODO not sure, maybe use 0
 		elif code[0:5] == 'USCMS':
-			area = self.id_csa['999']
+			area = cls.id_csa['999']
 		elif code[0:5] == 'USMSA':
-			area = self.id_cbsa['9999']
+			area = cls.id_cbsa['9999']
 		elif code[0:5] == 'USNMS':
-			area = self.id_gnis['1'] # TODO not sure
+			area = cls.id_gnis['1'] # TODO not sure
 		elif code[0:2] == 'CS':
-			area = self.id_csa[code[2:5]]
+			area = cls.id_csa[code[2:5]]
 		elif code[0] == 'C':
-			area = self.id_cbsa[code[1:5]+'0']
+			area = cls.id_cbsa[code[1:5]+'0']
 		elif code[2:5] in {'000','999'}:
-			area = self.id_gnis[m[(code[0:2], None)]] # XXX "Unknown Or Undefined" what is an areaRef for this?
+			area = cls.id_gnis[m[(code[0:2], None)]] # XXX "Unknown Or Undefined" what is an areaRef for this?
 		else:
-			area = self.id_gnis[m[(code[0:2], code[2:5])]]
+			area = cls.id_gnis[m[(code[0:2], code[2:5])]]
 
 		return area
 
@@ -156,6 +432,7 @@ class CEWGraph(StatsGraph):
 	#
 	#
 	def convert_acew(self, csv_reader, m):
+		n = 0
 		for n,row in enumerate(csv_reader, 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
@@ -178,40 +455,52 @@ class CEWGraph(StatsGraph):
 
 			assert qtr == 'A'
 			if disclosure_code == 'N':
+				metrics.skip('disclosure')
 				continue
 			if owner_code not in ('0','5'):
+				metrics.skip('owner')
 				continue
 			#if industry_code[:2] != '10' and len(industry_code) > 2 and '-' not in industry_code:
 			#	continue
 
-			area = self.decode_area2gnis(area_code, m)
-			if area is None: # XXX this still valid?
-				continue
+			self.add_acew(area_code, owner_code, industry_code, year, annual_avg_emplvl, avg_annual_pay, m)
+
+		metrics.count('rows', n)
+
+	##
+	# Add the observations of an annual row.
+	#
+	def add_acew(self, area_code, owner_code, industry_code, year, annual_avg_emplvl, avg_annual_pay, m):
+		area = m[area_code]
+		if area is None: # XXX this still valid?
+			metrics.skip('area')
+			return
+		ind = self.terms.uri(self.id_naics_ind, industry_code)
+		own = self.terms.uri(self.id_naics_own, owner_code)
+		time = self.terms.literal(year, rdflib.XSD.gYear)
+
+		if self.slices:
+			slice = self.id_cew['-'.join(['slice',area_code,industry_code,owner_code,year])]
+
+		url = self.id_cew['-'.join(['emplvl',area_code,industry_code,owner_code,year])]
+		if self.slices:
+			self.slice(slice, url, self.aslice, area, ind, own, time)
+			self.emplvla_sl.add(url, annual_avg_emplvl)
+		else:
+			self.emplvla.add(url, area, ind, own, time, annual_avg_emplvl)
 
-			url = self.id_cew['-'.join(['emplvl',area_code,industry_code,owner_code,year])]
-			self.g.add((url, rdflib.RDF.type, self.qb_obs))
-			self.g.add((url, rdflib.RDF.type, self.cew_emplvl))
-			self.g.add((url, self.sdmx_area, area))
-			self.g.add((url, self.cew_ind, self.id_naics_ind[industry_code]))
-			self.g.add((url, self.cew_own, self.id_naics_own[owner_code]))
-			self.g.add((url, self.sdmx_freq, self.sdmx_freqa))
-			self.g.add((url, self.sdmx_time, rdflib.Literal(year, datatype=rdflib.XSD.gYear)))
-			self.g.add((url, self.cew_people, rdflib.Literal(annual_avg_emplvl, datatype=rdflib.XSD.nonNegativeInteger)))
-
-			url = self.id_cew['-'.join(['avgapay',area_code,industry_code,owner_code,year])]
-			self.g.add((url, rdflib.RDF.type, self.qb_obs))
-			self.g.add((url, rdflib.RDF.type, self.cew_avgapay))
-			self.g.add((url, self.sdmx_area, area))
-			self.g.add((url, self.cew_ind, self.id_naics_ind[industry_code]))
-			self.g.add((url, self.cew_own, self.id_naics_own[owner_code]))
-			self.g.add((url, self.sdmx_freq, self.sdmx_freqa))
-			self.g.add((url, self.sdmx_time, rdflib.Literal(year, datatype=rdflib.XSD.gYear)))
-			self.g.add((url, self.sdmx_cur, rdflib.Literal(avg_annual_pay, datatype=rdflib.XSD.nonNegativeInteger)))
+		url = self.id_cew['-'.join(['avgapay',area_code,industry_code,owner_code,year])]
+		if self.slices:
+			self.slice(slice, url, self.aslice, area, ind, own, time)
+			self.avgapay_sl.add(url, avg_annual_pay)
+		else:
+			self.avgapay.add(url, area, ind, own, time, avg_annual_pay)
 
 	##
 	#
 	#
 	def convert_qcew(self, csv_reader, m):
+		n = 0
 		for n,row in enumerate(csv_reader, 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
@@ -234,62 +523,73 @@ class CEWGraph(StatsGraph):
 			avg_wkly_wage = row[15]
 
 			if disclosure_code == 'N':
+				metrics.skip('disclosure')
 				continue
 			if owner_code not in ('0','5'):
+				metrics.skip('owner')
 				continue
 			#if industry_code[:2] != '10' and len(industry_code) > 2 and '-' not in industry_code:
 			#	continue
 
-			area = self.decode_area2gnis(area_code, m)
-			if area is None: # XXX this still valid?
-				continue
+			self.add_qcew(area_code, owner_code, industry_code, year, qtr, month1_emplvl, month2_emplvl, month3_emplvl, avg_wkly_wage, m)
+
+		metrics.count('rows', n)
 
-			if qtr == '1':
-				month1_date = year+'-01'
-				month2_date = year+'-02'
-				month3_date = year+'-03'
-			elif qtr == '2':
-				month1_date = year+'-04'
-				month2_date = year+'-05'
-				month3_date = year+'-06'
-			elif qtr == '3':
-				month1_date = year+'-07'
-				month2_date = year+'-08'
-				month3_date = year+'-09'
-			elif qtr == '4':
-				month1_date = year+'-10'
-				month2_date = year+'-11'
-				month3_date = year+'-12'
-
-			if qtr == '1':
-				qdate = year+'-01'
-			elif qtr == '2':
-				qdate = year+'-04'
-			elif qtr == '3':
-				qdate = year+'-07'
-			elif qtr == '4':
-				qdate = year+'-10'
-
-			for lvl,month in {(month1_emplvl,month1_date), (month2_emplvl,month2_date), (month3_emplvl,month3_date)}:
-				url = self.id_cew['-'.join(['emplvl',area_code,industry_code,owner_code,month])]
-				self.g.add((url, rdflib.RDF.type, self.qb_obs))
-				self.g.add((url, rdflib.RDF.type, self.cew_emplvl))
-				self.g.add((url, self.sdmx_area, area))
-				self.g.add((url, self.cew_ind, self.id_naics_ind[industry_code]))
-				self.g.add((url, self.cew_own, self.id_naics_own[owner_code]))
-				self.g.add((url, self.sdmx_freq, self.sdmx_freqm))
-				self.g.add((url, self.sdmx_time, rdflib.Literal(month, datatype=rdflib.XSD.gYearMonth)))
-				self.g.add((url, self.cew_people, rdflib.Literal(lvl, datatype=rdflib.XSD.nonNegativeInteger)))
-
-			url = self.id_cew['-'.join(['avgwwage',area_code,industry_code,owner_code,qdate])]
-			self.g.add((url, rdflib.RDF.type, self.qb_obs))
-			self.g.add((url, rdflib.RDF.type, self.cew_avgwwage))
-			self.g.add((url, self.sdmx_area, area))
-			self.g.add((url, self.cew_ind, self.id_naics_ind[industry_code]))
-			self.g.add((url, self.cew_own, self.id_naics_own[owner_code]))
-			self.g.add((url, self.sdmx_freq, self.sdmx_freqq))
-			self.g.add((url, self.sdmx_time, rdflib.Literal(qdate, datatype=rdflib.XSD.gYearMonth)))
-			self.g.add((url, self.sdmx_cur, rdflib.Literal(avg_wkly_wage, datatype=rdflib.XSD.integer)))
+	##
+	# Add the observations of a quarterly row.
+	#
+	def add_qcew(self, area_code, owner_code, industry_code, year, qtr, month1_emplvl, month2_emplvl, month3_emplvl, avg_wkly_wage, m):
+		area = m[area_code]
+		if area is None: # XXX this still valid?
+			metrics.skip('area')
+			return
+		ind = self.terms.uri(self.id_naics_ind, industry_code)
+		own = self.terms.uri(self.id_naics_own, owner_code)
+
+		if qtr == '1':
+			month1_date = year+'-01'
+			month2_date = year+'-02'
+			month3_date = year+'-03'
+		elif qtr == '2':
+			month1_date = year+'-04'
+			month2_date = year+'-05'
+			month3_date = year+'-06'
+		elif qtr == '3':
+			month1_date = year+'-07'
+			month2_date = year+'-08'
+			month3_date = year+'-09'
+		elif qtr == '4':
+			month1_date = year+'-10'
+			month2_date = year+'-11'
+			month3_date = year+'-12'
+
+		if qtr == '1':
+			qdate = year+'-01'
+		elif qtr == '2':
+			qdate = year+'-04'
+		elif qtr == '3':
+			qdate = year+'-07'
+		elif qtr == '4':
+			qdate = year+'-10'
+
+		# one slice per series, across quarters
+		if self.slices:
+			slice = self.id_cew['-'.join(['slice',area_code,industry_code,owner_code])]
+
+		for lvl,month in {(month1_emplvl,month1_date), (month2_emplvl,month2_date), (month3_emplvl,month3_date)}:
+			url = self.id_cew['-'.join(['emplvl',area_code,industry_code,owner_code,month])]
+			if self.slices:
+				self.slice(slice, url, self.qslice, area, ind, own)
+				self.emplvlm_sl.add(url, self.terms.literal(month, rdflib.XSD.gYearMonth), lvl)
+			else:
+				self.emplvlm.add(url, area, ind, own, self.terms.literal(month, rdflib.XSD.gYearMonth), lvl)
+
+		url = self.id_cew['-'.join(['avgwwage',area_code,industry_code,owner_code,qdate])]
+		if self.slices:
+			self.slice(slice, url, self.qslice, area, ind, own)
+			self.avgwwage_sl.add(url, self.terms.literal(qdate, rdflib.XSD.gYearMonth), avg_wkly_wage)
+		else:
+			self.avgwwage.add(url, area, ind, own, self.terms.literal(qdate, rdflib.XSD.gYearMonth), avg_wkly_wage)
 
 if __name__ == '__main__':
 	main()
@@ -5,11 +5,42 @@ usage="""lau2rdf - convert US BLS Local Area Unemployment Statistics data into R
 See <https://www.bls.gov/lau/>. Requires python3, python3-rdfllib and 
 python3-bsddb3.
 
-Usage:  lau2rdf [options] la.data.* la.area laucnty##.txt GOVT_UNITS_*.txt NationalFedCodes_*.txt
+Inputs may be compressed as .gz, .bz2, .xz, .zst or single-file .zip,
+and the output as .gz, .bz2, .xz or .zst, by filename extension.
 
-	-o output	output file (default: stdout)
+Given several la.data files, or directories of them, resolves the areas
+once, then converts each data file into its own file in the output
+directory, named for the data file with the extension of the output
+format, in worker processes, and sums up the metrics.
+
+Usage:  lau2rdf [options] la.data.*|dir ... la.area laucnty##.txt GOVT_UNITS_*.txt NationalFedCodes_*.txt
+
+	-o output	output file (default: stdout), or directory for several data files
 	-d			enable debugging
-	-f fmt		use format for output file (default: turtle)
+	-f fmt		use format for output file (default: turtle; rdfbin and nt-sorted imply -s)
+	-s			stream triples to output as they are produced (nt, nt-sorted, turtle or rdfbin)
+	-b store	add to the persistent store directory, then save all of it
+	-j n		convert using n worker processes (implies -s); with several data
+			files, converts n files at a time
+	-x			with several data files, skip any whose rows are all in another,
+			e.g., la.data.7.Alabama next to la.data.2.AllStatesU (needs
+			uncompressed files sorted as published)
+	-m file		write a JSON metrics report to file
+	-u mb		drop repeated streamed triples, using up to mb MB of memory
+			(nt-sorted always drops them, and sorts in mb MB; default: 256)
+	-C dir		cache parsed reference files like GOVT_UNITS_*.txt in dir, and the
+			resolved areas, so later runs only match new or renamed cities
+	-c file		save a checkpoint to file every minute (needs -s and -o)
+	-R, --resume	resume from the checkpoint given with -c, or start if there is none
+	-D manifest	delta mode: write only observations added or changed since the run
+			that wrote manifest, then update it (implies -s; needs -f nt)
+	-r file		with -D, write SPARQL deletes of changed and removed observations
+			to file (default: manifest.delete.ru)
+	-A areas	only convert areas whose codes start with one of the comma-separated
+			prefixes, e.g., ST06,CN06 for California and its counties
+	-M meas		only convert the comma-separated measure codes, e.g., 03,06
+	-Y years	only convert the year or range of years, as 2010, 2010-2016,
+			2010- for 2010 on, or -2016 for up to 2016
 """
 
 import rdflib
@@ -20,12 +51,16 @@ import logging
 import getopt
 import re
 import collections
+import json
 
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'geonames'))
 from geonames2rdf import FIPS2GNISDict
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
-from stats import StatsGraph
+from stats import StatsGraph, LineFilter, output_files, StreamSink, BinarySink, SortedSink, DeltaSink, Dedup, stream_sink, stream_formats, StoreSink, Slot, Checkpoint, LineReader, metrics
+from fileio import input_files, drop_subsets, open_input, compressed, temp_name
+from refcache import refcache
+from names import bls_places
 
 ##
 # Commandline driver function.
@@ -33,12 +68,22 @@ from stats import StatsGraph
 def main():
 	outf = sys.stdout.buffer
 	outfmt = 'turtle'
+	stream = False
+	storedn = None
+	dedup = None
+	jobs = 1
+	checkfn = None
+	resume = False
+	manifestfn = None
+	deletefn = None
+	select = LineFilter('\t')
+	subsets = False
 	debuglvl = logging.INFO
 
 	logging.basicConfig(format='{levelname}/{funcName}/l{lineno} {message}', style='{', level=debuglvl)
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:')
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:sb:j:m:u:C:D:r:c:RA:M:Y:x', ['resume'])
 	except getopt.GetoptError as e:
 		logging.fatal('Getopt error {}'.format(e))
 		return 1
@@ -51,6 +96,41 @@ def main():
 		elif opt in {'-f', '--format'}:
 			# XXX verify, otherwise die and inform of valid input
 			outfmt = arg
+			stream = stream or outfmt in BinarySink.formats | SortedSink.formats
+		elif opt in {'-s', '--stream'}:
+			stream = True
+		elif opt in {'-b', '--store'}:
+			storedn = arg
+		elif opt in {'-u', '--unique'}:
+			dedup = int(arg) << 20
+		elif opt in {'-m', '--metrics'}:
+			metrics.enable(arg)
+		elif opt in {'-C', '--cache'}:
+			refcache.enable(arg)
+		elif opt in {'-j', '--jobs'}:
+			jobs = int(arg)
+			stream = stream or jobs > 1
+		elif opt in {'-D', '--delta'}:
+			manifestfn = arg
+			stream = True
+		elif opt in {'-r', '--deletes'}:
+			deletefn = arg
+		elif opt in {'-c', '--checkpoint'}:
+			checkfn = arg
+		elif opt in {'-R', '--resume'}:
+			resume = True
+		elif opt in {'-A', '--areas'}:
+			select.prefix(0, arg.split(','), 3, 18)
+		elif opt in {'-M', '--measures'}:
+			select.values(0, arg.split(','), 18, 20)
+		elif opt in {'-Y', '--years'}:
+			try:
+				select.span(1, arg)
+			except ValueError as e:
+				logging.fatal(e)
+				return 1
+		elif opt in {'-x', '--subsets'}:
+			subsets = True
 		elif opt in {'-h', '--help'}:
 			print(usage, file=sys.stderr)
 			return 0
@@ -63,24 +143,95 @@ def main():
 		print(usage, file=sys.stderr)
 		return 1
 
+	if stream and outfmt not in stream_formats:
+		logging.fatal('Cannot stream format {}'.format(outfmt))
+		return 1
+	if stream and storedn:
+		logging.fatal('Cannot both stream and use a store')
+		return 1
+	if checkfn and (not stream or outfmt not in StreamSink.formats or not isinstance(outf, str) or compressed(outf) or jobs > 1 or manifestfn):
+		logging.fatal('Checkpoints need a streamed, uncompressed nt or turtle output file')
+		return 1
+	if resume and not checkfn:
+		logging.fatal('Need a checkpoint to resume from')
+		return 1
+	if manifestfn and outfmt not in DeltaSink.formats:
+		logging.fatal('Cannot write format {} in delta mode'.format(outfmt))
+		return 1
+
+	datafns = input_files(args[:-4], 'la.data.*')
+	areafn = args[-4]
+	laucntyfn = args[-3]
+	govunitsfn = args[-2]
+	natfedfn = args[-1]
+	batch = len(datafns) != 1 or os.path.isdir(args[0])
+	if batch and not isinstance(outf, str):
+		logging.fatal('Need an output directory for several data files')
+		return 1
+	if batch and (manifestfn or storedn or checkfn):
+		logging.fatal('Cannot use delta mode, a store or checkpoints with several data files')
+		return 1
+
 	logging.getLogger().setLevel(debuglvl)
-	datafn = args[0]
-	areafn = args[1]
-	laucntyfn = args[2]
-	govunitsfn = args[3]
-	natfedfn = args[4]
 
-	logging.info("Creating AreaMap")
-	with open(areafn) as areaf, open(laucntyfn) as laucntyf, open(govunitsfn) as govunitsf, open(natfedfn) as natfedf:
-		aream = AreaMap(areaf, laucntyf, govunitsf, natfedf)
+	if batch:
+		if subsets:
+			with metrics.stage("Skipping subsets"):
+				datafns = drop_subsets(datafns)
+		try:
+			outfns = output_files(datafns, outf, outfmt)
+		except ValueError as e:
+			logging.fatal(e)
+			return 1
+
+	with metrics.stage("Creating AreaMap"):
+		aream = AreaMap(areafn, laucntyfn, govunitsfn, natfedfn, refcache.dn)
+
+	if batch:
+		os.makedirs(outf, exist_ok=True)
+		with metrics.stage("Building RDF"):
+			LAUGraph.convert_batch(datafns, outfns, jobs, outfmt, stream, 'parse_data', aream, select, dedup=dedup)
+		return 0
 
-	logging.info("Building RDF")
-	g = LAUGraph()
-	with open(datafn) as f:
-		g.parse_data(f, aream)
+	datafn = datafns[0]
+	checkpoint = Checkpoint(checkfn) if checkfn else None
+	try:
+		state = checkpoint.resume(datafn) if resume else None
+	except ValueError as e:
+		logging.fatal(e)
+		return 1
 
-	logging.info("Saving RDF")
-	g.serialize(outf, format=outfmt)
+	sink = None
+	if manifestfn:
+		sink = DeltaSink(outf, manifestfn, deletefn or manifestfn + '.delete.ru', Dedup(dedup) if dedup else None)
+	elif state:
+		logging.info("Resuming at byte {} of {}".format(state['offset'], state['input']))
+		sink = StreamSink.resume(outf, outfmt, state, Dedup(dedup) if dedup else None)
+		metrics.merge(state['counts'], state['skips'])
+	elif stream and jobs == 1:
+		sink = stream_sink(outf, outfmt, dedup)
+	elif storedn:
+		sink = StoreSink(storedn)
+
+	if jobs > 1:
+		with metrics.stage("Building RDF"):
+			LAUGraph.convert_sharded(datafn, jobs, outf, outfmt, 'parse_data', aream, select, sink=sink, dedup=dedup)
+		return 0
+
+	with metrics.stage("Building RDF"):
+		g = LAUGraph(sink)
+		if checkpoint:
+			g.checkpoint = checkpoint
+			start = state['offset'] if state else 0
+			g.parse_data(LineReader(datafn, start), aream, select, header=start == 0)
+		else:
+			with open_input(datafn) as f:
+				g.parse_data(f, aream, select)
+
+	with metrics.stage("Saving RDF"):
+		g.serialize(outf, format=outfmt)
+	if checkpoint:
+		checkpoint.remove()
 
 ##
 # A map of city names => GNIS ID.
@@ -88,14 +239,41 @@ def main():
 # TODO Currently only works for counties and most cities and towns.
 #
 class NameMap:
+	# regular expression special characters
+	special = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
 	##
 	# Use BGN NationalFedCodes file to pre-build map of state/county
 	# FIPS codes -> GNIS IDs etc.
 	#
-	# @input f: The BGN NationalFedCodes file.
+	# @input f: The BGN NationalFedCodes file, or its filename to read it
+	#           through the reference cache.
 	#
 	def __init__(self, f):
-		self.l = []
+		rows = refcache.rows(f, self.parse) if isinstance(f, str) else self.parse(f)
+		self.l = list(rows)
+
+		# (FIPS state, name) => GNIS ID of the first such entry
+		self.names = {}
+		# FIPS state => entries of Census class C, T or Z, for regular
+		# expression matches, and (FIPS state, trigram) => indexes of the
+		# entries whose names have it, to narrow down substring matches
+		self.places = collections.defaultdict(list)
+		self.trigrams = collections.defaultdict(list)
+		for item in self.l:
+			self.names.setdefault((item[3], item[1]), item[0])
+			if item[2][:1] in {'C','T','Z'}: # Townships, whatever Zs are
+				places = self.places[item[3]]
+				for trigram in {item[1][i:i+3] for i in range(len(item[1])-2)}:
+					self.trigrams[(item[3], trigram)].append(len(places))
+				places.append(item)
+
+	##
+	# Yield (GNIS ID, name, census class, FIPS state, FIPS county, county)
+	# for each row of the BGN NationalFedCodes file.
+	#
+	@staticmethod
+	def parse(f):
 		csv_reader = csv.reader(f, delimiter='|')
 		next(csv_reader)
 		for row in csv_reader:
@@ -105,7 +283,23 @@ class NameMap:
 			state_fips = row[7]
 			county_fips = row[10]
 			county = row[11]
-			self.l.append((gnis,name,census_class,state_fips,county_fips,county))
+			yield (gnis,name,census_class,state_fips,county_fips,county)
+
+	##
+	# Return the entries in a state, of Census class C, T or Z, whose names
+	# match the regular expression name, in file order. A name without
+	# special characters is a substring, so only the entries with all of
+	# its trigrams are tested.
+	#
+	def search(self, name, fips_s):
+		places = self.places.get(fips_s, [])
+		if len(name) < 3 or self.special.search(name):
+			r = re.compile(name)
+			return [item for item in places if r.search(item[1])]
+
+		postings = sorted((self.trigrams.get((fips_s, name[i:i+3]), []) for i in range(len(name)-2)), key=len)
+		candidates = set(postings[0]).intersection(*postings[1:])
+		return [places[i] for i in sorted(candidates) if name in places[i][1]]
 
 	##
 	# Find city and return its GNIS ID.
@@ -119,16 +313,12 @@ class NameMap:
 		fips_s = ac[2:4]
 
 		# Search for exact match.
-		for item in self.l:
-			if item[1] == name and item[3] == fips_s:
-				return item[0]
+		gnis = self.names.get((fips_s, name))
+		if gnis is not None:
+			return gnis
 
 		# Collect regular expression matches.
-		matches = []
-		for item in self.l:
-			# If re matches, they're in our state, and have the right Census class.
-			if re.search(name, item[1]) and item[3] == fips_s and item[2][0] in {'C','T','Z'}: # Townships, whatever Zs are
-				matches.append(item)
+		matches = self.search(name, fips_s)
 
 		# Return None if no matches.
 		if len(matches) == 0:
@@ -159,75 +349,7 @@ class NameMap:
 	#
 	@staticmethod
 	def normalize_name(name):
-		# Replacements.
-		name = name.replace('St.', 'Saint')
-
-		# Matching.
-		res = name.split(' city, ')
-		if len(res) > 1:
-			return 'City of '+res[0], None
-
-		res = name.split(' town, ')
-		if len(res) > 1:
-			return 'Town of '+res[0], None
-
-		res = name.split(' town (')
-		if len(res) > 1:
-			county = res[1].split(' County), ')[0]
-			return 'Town of '+res[0], county
-
-		res = name.split(' village, ')
-		if len(res) > 1:
-			return 'Village of '+res[0], None
-
-		res = name.split(' charter township, ')
-		if len(res) > 1:
-			return 'Charter Township of '+res[0], None
-
-		res = name.split(' charter township (')
-		if len(res) > 1:
-			county = res[1].split(' County), ')[0]
-			return 'Charter Township of '+res[0], county
-
-		res = name.split(' township, ')
-		if len(res) > 1:
-			return 'Township of '+res[0], None
-
-		res = name.split(' township (')
-		if len(res) > 1:
-			county = res[1].split(' County), ')[0]
-			return 'Township of '+res[0], county
-
-		res = name.split(' borough, ')
-		if len(res) > 1:
-			return 'Borough of '+res[0], None
-
-		res = name.split(' municipality, ')
-		if len(res) > 1:
-			return 'Municipality of '+res[0], None
-
-		res = name.split(' plantation, ')
-		if len(res) > 1:
-			return 'Plantation of '+res[0], None
-
-		res = name.split(' unorganized, ')
-		if len(res) > 1:
-			return 'Unorganized Territory of '+res[0], None
-
-		res = name.split(' gore, ')
-		if len(res) > 1:
-			return res[0]+' Gore', None
-
-		res = name.split(' grant, ')
-		if len(res) > 1:
-			return res[0]+' Grant', None
-
-		res = name.split(' location, ')
-		if len(res) > 1:
-			return res[0]+' Location', None
-
-		# XXX What if above tests fail? What's left?
-		return name, None
+		return bls_places.normalize(name)
 
 ##
 # A map of LAU area code => linked data ID URL.
@@ -239,33 +361,59 @@ class NameMap:
 #
 class AreaMap(collections.UserDict):
 	##
-	# @input areaf: <https://download.bls.gov/pub/time.series/la/la.area>.
-	# @input laucntyf: The LAU yearly county data file.
-	# @input govunitsf: The BGN "Government Units" file.
-	# @input natfedf: The BGN NationalFedCodes file.
+	# @input areafn: <https://download.bls.gov/pub/time.series/la/la.area>.
+	# @input laucntyfn: The LAU yearly county data file.
+	# @input govunitsfn: The BGN "Government Units" file.
+	# @input natfedfn: The BGN NationalFedCodes file.
+	# @input cachedn: A directory to keep the resolved areas in between
+	#                 runs, or None. The counties are kept in a file keyed
+	#                 by hashes of the county and "Government Units" files,
+	#                 and the cities, resolved or not, in one keyed by a hash
+	#                 of the NationalFedCodes file, both also by a hash of
+	#                 the code resolving them. So each set of reference
+	#                 files has its own, and only new or renamed cities are
+	#                 matched again.
 	#
-	def __init__(self, areaf, laucntyf, govunitsf, natfedf):
+	def __init__(self, areafn, laucntyfn, govunitsfn, natfedfn, cachedn=None):
 		super().__init__()
 
-		logging.info("Building FIPSMap")
-		fipsm = FIPS2GNISDict(govunitsf)
+		countyfn = cityfn = None
+		if cachedn:
+			countyfn = os.path.join(cachedn, 'AreaMap-counties-{}-{}-{}.json'.format(refcache.digest(laucntyfn), refcache.digest(govunitsfn), refcache.code(AreaMap.convert_county2gnis, FIPS2GNISDict)))
+			cityfn = os.path.join(cachedn, 'AreaMap-cities-{}-{}.json'.format(refcache.digest(natfedfn), refcache.code(AreaMap.convert_city2gnis, NameMap, bls_places.rules, bls_places.replacements, type(bls_places))))
 
-		logging.info("Building NameMap")
-		namem = NameMap(natfedf)
-
-		logging.info("Building map area => county GNIS")
-		self.convert_county2gnis(laucntyf, fipsm)
-
-		logging.info("Building map area => city GNIS")
-		self.convert_city2gnis(areaf, namem)
+		counties = self.load(countyfn)
+		if counties:
+			logging.info("Reusing counties from {}".format(countyfn))
+		else:
+			with metrics.stage("Building FIPSMap"):
+				fipsm = FIPS2GNISDict(govunitsfn)
+			with metrics.stage("Building map area => county GNIS"), open_input(laucntyfn) as f:
+				counties = self.convert_county2gnis(f, fipsm)
+			if countyfn:
+				self.save(countyfn, counties)
+
+		known = self.load(cityfn)
+		with metrics.stage("Building map area => city GNIS"), open_input(areafn) as f:
+			cities = self.convert_city2gnis(f, natfedfn, counties, known)
+		if cityfn and any(known.get(area) != city for area,city in cities.items()):
+			self.save(cityfn, dict(known, **cities))
+
+		for area,gnis in counties.items():
+			self[area] = StatsGraph.id_gnis[gnis]
+		for area,(name,gnis) in cities.items():
+			if gnis is not None:
+				self[area] = StatsGraph.id_gnis[gnis]
 
 	##
 	# Get LAU area => county GNIS mappings.
 	#
 	# @input f: <https://www.bls.gov/lau/laucnty16.txt>
 	# @input m: A FIPS2GNISDict.
+	# @return: A dictionary of area code => GNIS ID.
 	#
 	def convert_county2gnis(self, f, m):
+		counties = {}
 		#csv_reader = csv.reader(f, delimiter='|')
 		for i in range(6):
 			next(f) # skip headers
@@ -280,26 +428,70 @@ class AreaMap(collections.UserDict):
 			if gnis is None:
 				logging.warning("No GNIS for area {}".format(area))
 			else:
-				self[area] = StatsGraph.id_gnis[gnis]
+				counties[area] = gnis
+		return counties
 
 	##
+	# Get LAU area => city GNIS mappings, building the NameMap only if a
+	# city is not known.
+	#
 	# @input f: <https://download.bls.gov/pub/time.series/la/la.area>.
-	# @input m: A NameMap.
+	# @input natfedfn: The BGN NationalFedCodes file.
+	# @input counties: The county mappings, which take precedence.
+	# @input known: A dictionary of area code => (name, GNIS ID or None) of
+	#               cities already resolved.
+	# @return: A dictionary of area code => (name, GNIS ID or None).
 	#
-	def convert_city2gnis(self, f, m):
+	def convert_city2gnis(self, f, natfedfn, counties, known):
+		cities = {}
+		m = None
 		csv_reader = csv.reader(f, delimiter='\t')
 		next(csv_reader) # skip header
 
 		for row in csv_reader:
 			type = row[0] # see la.area_type
 			area = row[1]
-			if area in self.data:
+			if area in counties or area in cities:
 				continue
 			elif type in {'F', 'G', 'H'}: # XXX Should this include 'F' (counties)?
 				name = row[2]
-				gnis = m.map_city2gnis(name, area)
-				if gnis is not None:
-					self[area] = StatsGraph.id_gnis[gnis]
+				if area in known and known[area][0] == name:
+					cities[area] = known[area]
+					continue
+				if m is None:
+					with metrics.stage("Building NameMap"):
+						m = NameMap(natfedfn)
+				cities[area] = (name, m.map_city2gnis(name, area))
+		if m is None:
+			logging.info("Reused all {} cities".format(len(cities)))
+		return cities
+
+	##
+	# Return the contents of the cache file fn, or an empty dictionary if
+	# there is none.
+	#
+	@staticmethod
+	def load(fn):
+		if fn is None or not os.path.exists(fn):
+			return {}
+		with open(fn) as f:
+			return json.load(f)
+
+	##
+	# Write the cache file fn atomically, through a temporary file of its own
+	# so that concurrent datasets do not clobber each other.
+	#
+	@staticmethod
+	def save(fn, cache):
+		tmpfn = temp_name(fn)
+		try:
+			with open(tmpfn, 'w') as f:
+				json.dump(cache, f)
+			os.replace(tmpfn, fn)
+		except BaseException:
+			if os.path.exists(tmpfn):
+				os.remove(tmpfn)
+			raise
 
 ##
 # Represent a LAU graph.
@@ -323,92 +515,124 @@ class LAUGraph(StatsGraph):
 	##
 	#
 	#
-	def __init__(self):
-		super().__init__()
+	def __init__(self, sink=None):
+		super().__init__(sink)
 		self.g.bind('lau', self.id_lau)
 		self.g.bind('lau-ont', self.ont_lau)
+		self.measures = {
+			'03': ('runempl', self.observation(self.lau_runempl, self.lau_rate, rdflib.XSD.decimal)),
+			'04': ('tunempl', self.observation(self.lau_tunempl, self.lau_count, rdflib.XSD.nonNegativeInteger)),
+			'05': ('templ', self.observation(self.lau_templ, self.lau_count, rdflib.XSD.nonNegativeInteger)),
+			'06': ('tlf', self.observation(self.lau_tlf, self.lau_count, rdflib.XSD.nonNegativeInteger)),
+		}
+		# series ID => decoded series; see decode_series()
+		self.series = {}
+		# (year, period) => (date, frequency)
+		self.periods = {}
+
+	##
+	# Return an observation template, filled in with the observation's
+	# frequency, time period, measure value, GNIS area and seasonality.
+	#
+	def observation(self, typ, valtyp, datatype):
+		return self.template(
+			(rdflib.RDF.type, typ),
+			(self.sdmx_freq, Slot()),
+			(self.sdmx_time, Slot()),
+			(valtyp, Slot(datatype)),
+			(self.lau_gnis, Slot()),
+			(self.sdmx_adj, Slot()))
 
 	##
-	# @input f: An <la.data.*> file.
+	# @input f: An <la.data.*> file, or an iterable of its lines.
 	# @input m: An AreaMap object.
+	# @input select: A LineFilter of the rows to convert, or None for all.
+	# @input header: Whether the lines start with the header.
 	#
-	def parse_data(self, f, m):
-		csv_reader = csv.reader(f, delimiter='\t')
-		next(csv_reader)
+	def parse_data(self, f, m, select=None, header=True):
+		lines = iter(f)
+		if header:
+			next(lines, None)
+		csv_reader = csv.reader(select(lines) if select else lines, delimiter='\t')
 
+		n = 0
 		for n,row in enumerate(csv_reader, 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
+			self.tick(f, n-1)
 
 			sid = row[0].strip() #series_id
 			year = row[1].strip()
 			period = row[2].strip()
 			value = row[3].strip()
-	#		survey = sid[0:2]
-			seas = sid[2] # S=Seasonally Adjusted U=Unadjusted
-			ac = sid[3:18] # area_code
-			meas = sid[18:20] # measure_code
+
+			series = self.series.get(sid)
+			if series is None:
+				series = self.series[sid] = self.decode_series(sid, m)
 
 			# XXX skip rest for now
-			if ac not in m:
+			if series == 'area':
+				metrics.skip('area')
 				continue
 
 			# XXX not available. footcode 'N'
 			if value == '-':
+				metrics.skip('value')
 				continue
 
+			if series == 'measure':
+				metrics.skip('measure')
+				continue
+			prefix,obs,gnis,seas = series
+
 			# date
-			if period == 'M13':
-				date = rdflib.Literal(year, datatype=rdflib.XSD.gYear)
-				freqval = StatsGraph.sdmx_freqa
-			else:
-				date = rdflib.Literal(year+'-'+period.lstrip('M'), datatype=rdflib.XSD.gYearMonth)
-				freqval = StatsGraph.sdmx_freqm
-
-			# type
-			if meas == '03':
-				typ = 'runempl'
-				valtyp = self.lau_rate
-				obstypval = self.lau_runempl
-				dt = rdflib.XSD.decimal
-			elif meas == '04':
-				typ = 'tunempl'
-				valtyp = self.lau_count
-				obstypval = self.lau_tunempl
-				dt = rdflib.XSD.nonNegativeInteger
-			elif meas == '05':
-				typ = 'templ'
-				valtyp = self.lau_count
-				obstypval = self.lau_templ
-				dt = rdflib.XSD.nonNegativeInteger
-			elif meas == '06':
-				typ = 'tlf'
-				valtyp = self.lau_count
-				obstypval = self.lau_tlf
-				dt = rdflib.XSD.nonNegativeInteger
-			else:
-				logging.warning('Unknown meas')
-				valtyp = self.sdmx_obs
-				indval = rdflib.Literal(value)
+			when = self.periods.get((year, period))
+			if when is None:
+				when = self.periods[(year, period)] = self.decode_period(year, period)
+			date,freqval = when
 
 			# build URI
-			url = self.id_lau['_'.join([typ,sid,year,period])]
-
-			# add data
-			self.g.add((url, rdflib.RDF.type, obstypval))
-	#		self.g.add((url, self.lau_area, rdflib.Literal(ac, datatype=rdflib.XSD.string)))
-			self.g.add((url, self.sdmx_freq, freqval))
-			self.g.add((url, self.sdmx_time, date))
-			self.g.add((url, valtyp, rdflib.Literal(value, datatype=dt)))
-
-			# get GNIS from area code
-			if ac in m:
-				gnis = m[ac]
-				self.g.add((url, self.lau_gnis, gnis))
-
-			# seasonality
-			if seas == 'S':
-				self.g.add((url, self.sdmx_adj, self.lau_seas))
+			url = self.id_lau[prefix+year+'_'+period]
+
+			# add data, with GNIS from area code and seasonality
+			obs.add(url, freqval, date, value, gnis, seas)
+
+		metrics.count('rows', n)
+
+	##
+	# Decode a series ID, once per series.
+	#
+	# @input sid: The series ID.
+	# @input m: An AreaMap object.
+	# @return: 'area' or 'measure' if the series is skipped for its area or
+	#          unknown measure, else a tuple of the observation URI prefix,
+	#          the observation template, the GNIS area and the seasonality.
+	#
+	def decode_series(self, sid, m):
+	#	survey = sid[0:2]
+		seas = sid[2] # S=Seasonally Adjusted U=Unadjusted
+		ac = sid[3:18] # area_code
+		meas = sid[18:20] # measure_code
+
+		if ac not in m:
+			return 'area'
+
+		# type
+		if meas not in self.measures:
+			logging.warning('Unknown meas {} in {}'.format(meas, sid))
+			return 'measure'
+		typ,obs = self.measures[meas]
+
+		return typ+'_'+sid+'_', obs, m[ac], self.lau_seas if seas == 'S' else None
+
+	##
+	# Return the date and frequency of a year and period.
+	#
+	def decode_period(self, year, period):
+		if period == 'M13':
+			return self.terms.literal(year, rdflib.XSD.gYear), StatsGraph.sdmx_freqa
+		else:
+			return self.terms.literal(year+'-'+period.lstrip('M'), rdflib.XSD.gYearMonth), StatsGraph.sdmx_freqm
 
 if __name__ == '__main__':
 	main()
@@ -5,11 +5,36 @@ usage="""oes2rdf - convert US BLS Occupational Employment Statistics dataset int
 See <https://www.bls.gov/oes/>. Requires python3, python3-rdfllib and 
 python3-bsddb3.
 
+Inputs may be compressed as .gz, .bz2, .xz, .zst or single-file .zip,
+and the output as .gz, .bz2, .xz or .zst, by filename extension.
+
 Usage:  oes2rdf [options] oe.data.1.AllData oe.industry GOVT_UNITS_*.txt
 
 	-o output	output file (default: stdout)
 	-d			enable debugging
-	-f fmt		use format for output file (default: turtle)
+	-f fmt		use format for output file (default: turtle; rdfbin and nt-sorted imply -s)
+	-s			stream triples to output as they are produced (nt, nt-sorted, turtle or rdfbin)
+	-b store	add to the persistent store directory, then save all of it
+	-j n		convert using n worker processes (implies -s)
+	-m file		write a JSON metrics report to file
+	-u mb		drop repeated streamed triples, using up to mb MB of memory
+			(nt-sorted always drops them, and sorts in mb MB; default: 256)
+	-C dir		cache parsed reference files like GOVT_UNITS_*.txt in dir
+	-c file		save a checkpoint to file every minute (needs -s and -o)
+	-R, --resume	resume from the checkpoint given with -c, or start if there is none
+	-A areas	only convert areas whose codes start with one of the comma-separated
+			prefixes, e.g., 06 for California
+	-I inds		only convert industries whose codes start with one of the
+			comma-separated prefixes
+	-M types	only convert the comma-separated datatype codes, e.g., 01,04
+	-Y years	only convert the year or range of years, as 2010, 2010-2016,
+			2010- for 2010 on, or -2016 for up to 2016
+	-S			group the observations of each series and year into a qb:Slice,
+			which has their shared area, industry, ownership, occupation,
+			frequency and year, instead of each observation. A slice costs
+			about as many triples as it saves per observation, so only use
+			it when most occupations have several of the datatypes, e.g.,
+			not with -M and one datatype, where the output grows
 """
 
 import rdflib
@@ -25,6 +50,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'geonames'))
 from geonames2rdf import FIPS2GNISDict
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
 import stats
+import fileio
+from refcache import refcache
 
 ##
 # Driver function. Create FIPS-to-GNISID map, then create RDF data cube graph,
@@ -33,12 +60,20 @@ import stats
 def main():
 	outf = sys.stdout.buffer
 	outfmt = 'turtle'
+	stream = False
+	storedn = None
+	dedup = None
+	jobs = 1
+	checkfn = None
+	resume = False
+	select = stats.LineFilter('\t')
+	slices = False
 	debuglvl = logging.INFO
 
 	logging.basicConfig(format='{levelname}/{funcName} {message}', style='{', level=debuglvl)
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:')
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:sb:j:m:u:C:c:RA:I:M:Y:S', ['resume'])
 	except getopt.GetoptError as e:
 		logging.fatal('getopt error {}'.format(e))
 		return 1
@@ -51,6 +86,38 @@ def main():
 		elif opt in {'-f', '--format'}:
 			# XXX verify, otherwise die and inform of valid input
 			outfmt = arg
+			stream = stream or outfmt in stats.BinarySink.formats | stats.SortedSink.formats
+		elif opt in {'-s', '--stream'}:
+			stream = True
+		elif opt in {'-b', '--store'}:
+			storedn = arg
+		elif opt in {'-u', '--unique'}:
+			dedup = int(arg) << 20
+		elif opt in {'-m', '--metrics'}:
+			stats.metrics.enable(arg)
+		elif opt in {'-C', '--cache'}:
+			refcache.enable(arg)
+		elif opt in {'-j', '--jobs'}:
+			jobs = int(arg)
+			stream = stream or jobs > 1
+		elif opt in {'-c', '--checkpoint'}:
+			checkfn = arg
+		elif opt in {'-R', '--resume'}:
+			resume = True
+		elif opt in {'-A', '--areas'}:
+			select.prefix(0, arg.split(','), 4, 11)
+		elif opt in {'-I', '--industries'}:
+			select.prefix(0, arg.split(','), 11, 17)
+		elif opt in {'-M', '--datatypes'}:
+			select.values(0, arg.split(','), 23, 25)
+		elif opt in {'-Y', '--years'}:
+			try:
+				select.span(1, arg)
+			except ValueError as e:
+				logging.fatal(e)
+				return 1
+		elif opt in {'-S', '--slices'}:
+			slices = True
 		elif opt in {'-h', '--help'}:
 			print(usage, file=sys.stderr)
 			return 0
@@ -63,26 +130,66 @@ def main():
 		print(usage, file=sys.stderr)
 		return 1
 
+	if stream and outfmt not in stats.stream_formats:
+		logging.fatal('cannot stream format {}'.format(outfmt))
+		return 1
+	if stream and storedn:
+		logging.fatal('cannot both stream and use a store')
+		return 1
+	if checkfn and (not stream or outfmt not in stats.StreamSink.formats or not isinstance(outf, str) or fileio.compressed(outf) or jobs > 1):
+		logging.fatal('checkpoints need a streamed, uncompressed nt or turtle output file')
+		return 1
+	if resume and not checkfn:
+		logging.fatal('need a checkpoint to resume from')
+		return 1
+
 	logging.getLogger().setLevel(debuglvl)
 	datafn = args[0] # oe.data.0.Current
 	indfn = args[1] # oe.industry
 	govfn = args[2] # GOVT_UNITS_*.txt
 
-	logging.info("Building FIPS->GNIS dictionary")
-	with open(govfn) as f:
-		gnism = FIPS2GNISDict(f)
+	with stats.metrics.stage("Building FIPS->GNIS dictionary"):
+		gnism = FIPS2GNISDict(govfn)
 
-	logging.info("Building industry->NAICS dictionary")
-	with open(indfn) as f:
+	with stats.metrics.stage("Building industry->NAICS dictionary"), fileio.open_input(indfn) as f:
 		indm = IndustryMap(f)
 
-	logging.info("Building RDF")
-	g = OESGraph()
-	with open(datafn) as f:
-		g.build_data(f, gnism, indm)
+	if jobs > 1:
+		with stats.metrics.stage("Building RDF"):
+			OESGraph.convert_sharded(datafn, jobs, outf, outfmt, 'build_data', gnism, indm, select, slices, dedup=dedup)
+		return 0
+
+	checkpoint = stats.Checkpoint(checkfn) if checkfn else None
+	try:
+		state = checkpoint.resume(datafn) if resume else None
+	except ValueError as e:
+		logging.fatal(e)
+		return 1
+
+	sink = None
+	if state:
+		logging.info("resuming at byte {} of {}".format(state['offset'], state['input']))
+		sink = stats.StreamSink.resume(outf, outfmt, state, stats.Dedup(dedup) if dedup else None)
+		stats.metrics.merge(state['counts'], state['skips'])
+	elif stream:
+		sink = stats.stream_sink(outf, outfmt, dedup)
+	elif storedn:
+		sink = stats.StoreSink(storedn)
+
+	with stats.metrics.stage("Building RDF"):
+		g = OESGraph(sink)
+		if checkpoint:
+			g.checkpoint = checkpoint
+			start = state['offset'] if state else 0
+			g.build_data(stats.LineReader(datafn, start), gnism, indm, select, slices, header=start == 0)
+		else:
+			with fileio.open_input(datafn) as f:
+				g.build_data(f, gnism, indm, select, slices)
 
-	logging.info("Saving RDF")
-	g.serialize(outf, format=outfmt)
+	with stats.metrics.stage("Saving RDF"):
+		g.serialize(outf, format=outfmt)
+	if checkpoint:
+		checkpoint.remove()
 
 ##
 # Use oe.industry file to pre-build map of industry codes to -> NAICS codes.
@@ -141,26 +248,86 @@ class OESGraph(stats.StatsGraph):
 	##
 	#
 	#
-	def __init__(self):
-		super().__init__()
+	def __init__(self, sink=None):
+		super().__init__(sink)
 		self.g.bind('oes-ont', self.ont_oes)
+		self.datatypes = {
+			'01': self.observation(self.oes_emp, self.oes_people, rdflib.XSD.nonNegativeInteger),
+			'02': self.observation(self.oes_empsem, self.oes_rse, rdflib.XSD.decimal),
+			'04': self.observation(self.oes_wagemeana, self.sdmx_cur, rdflib.XSD.nonNegativeInteger),
+			'05': self.observation(self.oes_wagsem, self.oes_rse, rdflib.XSD.decimal),
+			'13': self.observation(self.oes_wagemeda, self.sdmx_cur, rdflib.XSD.nonNegativeInteger),
+		}
+		# with slices, the observations only have what they do not share
+		self.slices = False
+		self.oslice = self.slice_template(
+			(self.sdmx_area, stats.Slot()),
+			(self.oes_ind, stats.Slot()),
+			(self.oes_own, stats.Slot()),
+			(self.oes_soc, stats.Slot()),
+			(self.sdmx_freq, self.sdmx_freqa),
+			(self.sdmx_time, stats.Slot()))
+		self.datatypes_sl = {
+			'01': self.sliced_observation(self.oes_emp, self.oes_people, rdflib.XSD.nonNegativeInteger),
+			'02': self.sliced_observation(self.oes_empsem, self.oes_rse, rdflib.XSD.decimal),
+			'04': self.sliced_observation(self.oes_wagemeana, self.sdmx_cur, rdflib.XSD.nonNegativeInteger),
+			'05': self.sliced_observation(self.oes_wagsem, self.oes_rse, rdflib.XSD.decimal),
+			'13': self.sliced_observation(self.oes_wagemeda, self.sdmx_cur, rdflib.XSD.nonNegativeInteger),
+		}
+
+	##
+	# Return an observation template, filled in with the observation's
+	# area, series, industry, ownership, occupation, year and value.
+	#
+	def observation(self, typ, measure, datatype):
+		return self.template(
+			(rdflib.RDF.type, self.qb_obs),
+			(self.sdmx_area, stats.Slot()),
+			(self.oes_series, stats.Slot()),
+			(self.oes_ind, stats.Slot()),
+			(self.oes_own, stats.Slot()),
+			(self.oes_soc, stats.Slot()),
+			(self.sdmx_freq, self.sdmx_freqa),
+			(self.sdmx_time, stats.Slot()),
+			(rdflib.RDF.type, typ),
+			(measure, stats.Slot(datatype)))
+
+	##
+	# Return a template for an observation in a slice, filled in with the
+	# observation's series and value. It has none of the dimensions the
+	# slice fixes, nor the type qb:Observation, which qb:observation and
+	# the type typ imply.
+	#
+	def sliced_observation(self, typ, measure, datatype):
+		return self.template(
+			(self.oes_series, stats.Slot()),
+			(rdflib.RDF.type, typ),
+			(measure, stats.Slot(datatype)))
 
 	##
 	# Parse oe.data file and build OESGraph.
 	#
 	# TODO: Don't skip any record types.
 	#
-	# @input f: The data file, e.g., <oe.data.0.Current>.
+	# @input f: The data file, e.g., <oe.data.0.Current>, or an iterable of its lines.
 	# @input gnism: A dictionary mapping FIPS IDs to GNIS IDs, i.e., a FIPS2GNISDict.
 	# @input indm: A dictionary mapping industry codes to NAICS codes, i.e., a IndustryMap.
+	# @input select: A stats.LineFilter of the rows to convert, or None for all.
+	# @input slices: Whether to group observations into slices.
+	# @input header: Whether the lines start with the header.
 	#
-	def build_data(self, f, gnism, indm):
-		csv_reader = csv.reader(f, delimiter='\t', skipinitialspace=True)
-		next(csv_reader)
+	def build_data(self, f, gnism, indm, select=None, slices=False, header=True):
+		self.slices = slices
+		lines = iter(f)
+		if header:
+			next(lines, None)
+		csv_reader = csv.reader(select(lines) if select else lines, delimiter='\t', skipinitialspace=True)
 
+		n = 0
 		for n,row in enumerate(csv_reader, 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
+			self.tick(f, n-1)
 
 			series = row[0].strip()
 			year = row[1].strip()
@@ -172,6 +339,7 @@ class OESGraph(stats.StatsGraph):
 			assert period == 'A01'
 			# XXX: Need to remove this.
 			if year != '2016':
+				stats.metrics.skip('year')
 				continue
 
 			areaurl,indurl,ownurl,socurl,datatype = self.parse_series_id(series, gnism, indm)
@@ -179,29 +347,14 @@ class OESGraph(stats.StatsGraph):
 				continue
 
 			url = self.id_oes['-'.join([series,year,period])]
-			self.g.add((url, rdflib.RDF.type, self.qb_obs))
-			self.g.add((url, self.sdmx_area, areaurl))
-			self.g.add((url, self.oes_series, self.id_oes[series]))
-			self.g.add((url, self.oes_ind, indurl))
-			self.g.add((url, self.oes_own, ownurl))
-			self.g.add((url, self.oes_soc, socurl))
-			self.g.add((url, self.sdmx_freq, self.sdmx_freqa))
-			self.g.add((url, self.sdmx_time, rdflib.Literal(year, datatype=rdflib.XSD.gYear)))
-			if datatype == '01':
-				self.g.add((url, rdflib.RDF.type, self.oes_emp))
-				self.g.add((url, self.oes_people, rdflib.Literal(value, datatype=rdflib.XSD.nonNegativeInteger)))
-			elif datatype == '02':
-				self.g.add((url, rdflib.RDF.type, self.oes_empsem))
-				self.g.add((url, self.oes_rse, rdflib.Literal(value, datatype=rdflib.XSD.decimal)))
-			elif datatype == '04':
-				self.g.add((url, rdflib.RDF.type, self.oes_wagemeana))
-				self.g.add((url, self.sdmx_cur, rdflib.Literal(value, datatype=rdflib.XSD.nonNegativeInteger)))
-			elif datatype == '05':
-				self.g.add((url, rdflib.RDF.type, self.oes_wagsem))
-				self.g.add((url, self.oes_rse, rdflib.Literal(value, datatype=rdflib.XSD.decimal)))
-			elif datatype == '13':
-				self.g.add((url, rdflib.RDF.type, self.oes_wagemeda))
-				self.g.add((url, self.sdmx_cur, rdflib.Literal(value, datatype=rdflib.XSD.nonNegativeInteger)))
+			if self.slices:
+				slice = self.id_oes['-'.join(['slice',series[:23],year,period])]
+				self.slice(slice, url, self.oslice, areaurl, indurl, ownurl, socurl, self.terms.literal(year, rdflib.XSD.gYear))
+				self.datatypes_sl[datatype].add(url, self.id_oes[series], value)
+			else:
+				self.datatypes[datatype].add(url, areaurl, self.id_oes[series], indurl, ownurl, socurl, self.terms.literal(year, rdflib.XSD.gYear), value)
+
+		stats.metrics.count('rows', n)
 
 	##
 	# Parse the series_id field. Return None if we should skip record.
@@ -218,25 +371,27 @@ class OESGraph(stats.StatsGraph):
 		datatype = s[23:25]
 
 		assert survey == 'OE'
-		if datatype not in {'01','02', '04', '05', '13'}:
+		if datatype not in self.datatypes:
 			#logging.debug("skipping record: datatype {0}".format(datatype))
+			stats.metrics.skip('datatype')
 			return (None,)*5
 
 		if area == '0000000':
 			areaurl = self.id_gnis['1890467']
 		elif area[0:2] != '00' and area[2:7] == '00000':
-			areaurl = self.id_gnis[gnism[(area[0:2], None)]]
+			areaurl = self.terms.uri(self.id_gnis, gnism[(area[0:2], None)])
 		elif area[0:2] != '00' and area[2:7] != '00000':
 			# TODO
 			logging.debug("skipping record: nonmetro area {0}".format(area))
+			stats.metrics.skip('area')
 			return (None,)*5
 		else:
-			areaurl = self.id_cbsa[area[2:7]]
+			areaurl = self.terms.uri(self.id_cbsa, area[2:7])
 
 		ind,own = indm[industry]
-		indurl = self.id_naics_ind[ind]
-		ownurl = self.id_naics_own[own]
-		socurl = self.id_soc[s[0:2]+'-'+s[2:6]]
+		indurl = self.terms.uri(self.id_naics_ind, ind)
+		ownurl = self.terms.uri(self.id_naics_own, own)
+		socurl = self.terms.uri(self.id_soc, s[0:2]+'-'+s[2:6])
 
 		return areaurl,indurl,ownurl,socurl,datatype
 
@@ -5,12 +5,20 @@ usage="""sf2rdf - convert the US Census Bureau Summary File datasets into RDF
 See <https://www.bls.gov/cew/>. Requires python3, python3-rdfllib and 
 python3-bsddb3.
 
+The output may be compressed as .gz, .bz2, .xz or .zst, by filename
+extension.
+
 Usage:  sf2rdf [options] *.sf1.zip
 Arguments:
 
 	-o output	output file (default: stdout)
 	-d			enable debugging
-	-f fmt		use format for output file (default: turtle)
+	-f fmt		use format for output file (default: turtle; rdfbin and nt-sorted imply -s)
+	-s			stream triples to output as they are produced (nt, nt-sorted, turtle or rdfbin)
+	-b store	add to the persistent store directory, then save all of it
+	-m file		write a JSON metrics report to file
+	-u mb		drop repeated streamed triples, using up to mb MB of memory
+			(nt-sorted always drops them, and sorts in mb MB; default: 256)
 """
 
 import rdflib
@@ -25,7 +33,7 @@ import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'geonames'))
 from geonames2rdf import FIPS2GNISDict
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
-from stats import StatsGraph
+from stats import StatsGraph, BinarySink, SortedSink, stream_sink, stream_formats, StoreSink, Slot, metrics
 
 ##
 # Driver function. Create FIPS-to-GNISID map, then create RDF data cube graph,
@@ -34,12 +42,15 @@ from stats import StatsGraph
 def main():
 	outf = sys.stdout.buffer
 	outfmt = 'turtle'
+	stream = False
+	storedn = None
+	dedup = None
 	debuglvl = logging.INFO
 
 	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:')
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:sb:m:u:')
 	except getopt.GetoptError as e:
 		logging.fatal('Getopt error {}'.format(e))
 		return 1
@@ -52,6 +63,15 @@ def main():
 		elif opt in {'-f', '--format'}:
 			# XXX verify, otherwise die and inform of valid input
 			outfmt = arg
+			stream = stream or outfmt in BinarySink.formats | SortedSink.formats
+		elif opt in {'-s', '--stream'}:
+			stream = True
+		elif opt in {'-b', '--store'}:
+			storedn = arg
+		elif opt in {'-u', '--unique'}:
+			dedup = int(arg) << 20
+		elif opt in {'-m', '--metrics'}:
+			metrics.enable(arg)
 		elif opt in {'-h', '--help'}:
 			print(usage, file=sys.stderr)
 			return 0
@@ -64,17 +84,29 @@ def main():
 		print(usage, file=sys.stderr)
 		return 1
 
+	if stream and outfmt not in stream_formats:
+		logging.fatal('Cannot stream format {}'.format(outfmt))
+		return 1
+	if stream and storedn:
+		logging.fatal('Cannot both stream and use a store')
+		return 1
+
 	logging.getLogger().setLevel(debuglvl)
 
-	logging.info("Creating RDF graph")
-	g = SF1Graph()
+	sink = None
+	if stream:
+		sink = stream_sink(outf, outfmt, dedup)
+	elif storedn:
+		sink = StoreSink(storedn)
+
+	with metrics.stage("Creating RDF graph"):
+		g = SF1Graph(sink)
 
-	logging.info("Building RDF")
-	with zipfile.ZipFile(args[0]) as zipf:
+	with metrics.stage("Building RDF"), zipfile.ZipFile(args[0]) as zipf:
 		g.convert(zipf)
 
-	logging.info("Saving RDF")
-	g.serialize(outf, format=outfmt)
+	with metrics.stage("Saving RDF"):
+		g.serialize(outf, format=outfmt)
 
 ##
 #
@@ -87,9 +119,15 @@ class SF1Graph(StatsGraph):
 	##
 	#
 	#
-	def __init__(self):
-		super().__init__()
+	def __init__(self, sink=None):
+		super().__init__(sink)
 		self.g.bind('sf1-ont', self.ont_sf1)
+		self.obs = self.template(
+			(rdflib.RDF.type, self.ont_sf1['CensusObservation']),
+			(self.sdmx_dimension['refArea'], Slot()),
+			(self.sdmx_dimension['timePeriod'], rdflib.Literal('2010-04-01', datatype=rdflib.XSD.date)),
+			(self.ont_sf1['matrix'], Slot()),
+			(self.ont_sf1['people'], Slot(rdflib.XSD.nonNegativeInteger)))
 
 	##
 	# TODO Assumes year.
@@ -106,7 +144,8 @@ class SF1Graph(StatsGraph):
 	# Only works on segment 4, i.e., <ca000042010.sf1>.
 	#
 	def convert_seg04(self, geof, segf):
-		for n,(lgeo,lseg) in enumerate(zip(geof,segf)):
+		n = 0
+		for n,(lgeo,lseg) in enumerate(zip(geof,segf), 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
 
@@ -132,32 +171,32 @@ class SF1Graph(StatsGraph):
 
 			# see 4-9
 			if geo_sumlev == '050': # county level
-				area = self.id_gnis[geo_countyns]
+				area = self.terms.uri(self.id_gnis, geo_countyns)
 				arean = 'gnis'+geo_countyns
 			elif geo_sumlev == '040': # state level
-				area = self.id_gnis[geo_statens]
+				area = self.terms.uri(self.id_gnis, geo_statens)
 				arean = 'gnis'+geo_statens
 			elif geo_sumlev == '310': # cbsa level
-				area = self.id_cbsa[geo_cbsa]
+				area = self.terms.uri(self.id_cbsa, geo_cbsa)
 				arean = 'cbsa'+geo_cbsa
 			elif geo_sumlev == '330': # csa level
-				area = self.id_csa[geo_csa]
+				area = self.terms.uri(self.id_csa, geo_csa)
 				arean = 'csa'+geo_csa
 			else:
+				metrics.skip('summary level')
 				continue
 
 			# see 6-2 and 6-15 footnotes, 4-9
 			if geo_geocomp != '00':
+				metrics.skip('geographic component')
 				continue
 
 			for i in range(1,49+1):
 				dim = 'P01200' + '{:02d}'.format(i)
 				url = self.id_sf1['-'.join(['sf1','2012',dim,arean])]
-				self.g.add((url, rdflib.RDF.type, self.ont_sf1['CensusObservation']))
-				self.g.add((url, self.sdmx_dimension['refArea'], area))
-				self.g.add((url, self.sdmx_dimension['timePeriod'], rdflib.Literal('2010-04-01', datatype=rdflib.XSD.date)))
-				self.g.add((url, self.ont_sf1['matrix'], rdflib.Literal(dim, datatype=rdflib.XSD.string)))
-				self.g.add((url, self.ont_sf1['people'], rdflib.Literal(lseg[4+71+73+i], datatype=rdflib.XSD.nonNegativeInteger)))
+				self.obs.add(url, area, self.terms.literal(dim, rdflib.XSD.string), lseg[4+71+73+i])
+
+		metrics.count('rows', n)
 
 if __name__ == '__main__':
 	main()
@@ -5,12 +5,21 @@ usage="""geonames2rdf - convert the US BGN "federal codes" dataset into RDF
 See <http://geonames.usgs.gov/domestic/download_data.htm> under "Topical
 Gazetteers/Government Units" and "State Files with Federal Codes".
 
+Inputs may be compressed as .gz, .bz2, .xz, .zst or single-file .zip,
+and the output as .gz, .bz2, .xz or .zst, by filename extension.
+
 Usage:  geonames2rdf [options] GOVT_UNITS_*.txt NationalFedCodes_*.txt
 Arguments:
 
 	-o output	output file (default: stdout)
 	-d			enable debugging
-	-f fmt		use format for output file (default: turtle)
+	-f fmt		use format for output file (default: turtle; rdfbin and nt-sorted imply -s)
+	-s			stream triples to output as they are produced (nt, nt-sorted, turtle or rdfbin)
+	-b store	add to the persistent store directory, then save all of it
+	-m file		write a JSON metrics report to file
+	-u mb		drop repeated streamed triples, using up to mb MB of memory
+			(nt-sorted always drops them, and sorts in mb MB; default: 256)
+	-C dir		cache parsed reference files like GOVT_UNITS_*.txt in dir
 """
 
 import csv
@@ -22,7 +31,9 @@ import collections
 
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
-from stats import StatsGraph
+from stats import StatsGraph, BinarySink, SortedSink, stream_sink, stream_formats, StoreSink, metrics
+from fileio import open_input
+from refcache import refcache
 
 ##
 # Driver function. Create FIPS-to-GNISID map, then create feature RDF graph,
@@ -31,12 +42,15 @@ from stats import StatsGraph
 def main():
 	outf = sys.stdout.buffer
 	outfmt = 'turtle'
+	stream = False
+	storedn = None
+	dedup = None
 	debuglvl = logging.INFO
 
 	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:')
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:df:sb:m:u:C:')
 	except getopt.GetoptError as e:
 		logging.fatal('Getopt error {}'.format(e))
 		return 1
@@ -49,6 +63,17 @@ def main():
 		elif opt in {'-f', '--format'}:
 			# XXX verify, otherwise die and inform of valid input
 			outfmt = arg
+			stream = stream or outfmt in BinarySink.formats | SortedSink.formats
+		elif opt in {'-s', '--stream'}:
+			stream = True
+		elif opt in {'-b', '--store'}:
+			storedn = arg
+		elif opt in {'-u', '--unique'}:
+			dedup = int(arg) << 20
+		elif opt in {'-m', '--metrics'}:
+			metrics.enable(arg)
+		elif opt in {'-C', '--cache'}:
+			refcache.enable(arg)
 		elif opt in {'-h', '--help'}:
 			print(usage, file=sys.stderr)
 			return 0
@@ -61,27 +86,37 @@ def main():
 		print(usage, file=sys.stderr)
 		return 1
 
+	if stream and outfmt not in stream_formats:
+		logging.fatal('Cannot stream format {}'.format(outfmt))
+		return 1
+	if stream and storedn:
+		logging.fatal('Cannot both stream and use a store')
+		return 1
+
 	logging.getLogger().setLevel(debuglvl)
 	govfn = args[0] # GOVT_UNITS_*.txt
 	codesfn = args[1] # NationalFedCodes_*.txt
 
-	logging.info("Building FIPS2GNISDict")
-	with open(govfn) as f:
-		m = FIPS2GNISDict(f)
+	with metrics.stage("Building FIPS2GNISDict"):
+		m = FIPS2GNISDict(govfn)
+
+	sink = None
+	if stream:
+		sink = stream_sink(outf, outfmt, dedup)
+	elif storedn:
+		sink = StoreSink(storedn)
 
-	logging.info("Creating graph")
-	g = GeonamesGraph()
+	with metrics.stage("Creating graph"):
+		g = GeonamesGraph(sink)
 
-	logging.info("Adding states to graph")
-	with open(govfn) as f:
+	with metrics.stage("Adding states to graph"), open_input(govfn) as f:
 		g.convert_fips2gnis(f)
 
-	logging.info("Building RDF")
-	with open(codesfn) as f:
+	with metrics.stage("Building RDF"), open_input(codesfn) as f:
 		g.convert_fedcodes(f, m)
 
-	logging.info("Saving RDF")
-	g.serialize(outf, format=outfmt)
+	with metrics.stage("Saving RDF"):
+		g.serialize(outf, format=outfmt)
 
 ##
 # A map from (FIPS state numeric, FIPS county numeric) => GNIS ID. The BGN
@@ -99,20 +134,28 @@ class FIPS2GNISDict(collections.UserDict):
 	# Use BGN "Government Units" file to pre-build map of state/county
 	# FIPS codes -> GNIS IDs.
 	#
-	# @input f: The BGN "Government Units" file.
+	# @input f: The BGN "Government Units" file, or its filename to read
+	#           it through the reference cache.
 	#
 	def __init__(self, f):
 		super().__init__()
-		csv_reader = csv.reader(f, delimiter='|')
-		next(csv_reader)
-		for row in csv_reader:
-			state = row[4]
-			county = row[2]
-			gnis = row[0]
+		rows = refcache.rows(f, self.parse) if isinstance(f, str) else self.parse(f)
+		for state,county,gnis in rows:
 			if county == '':
 				county = None
 			self[(state, county)] = gnis
 
+	##
+	# Yield (FIPS state, FIPS county, GNIS ID) for each row of the BGN
+	# "Government Units" file.
+	#
+	@staticmethod
+	def parse(f):
+		csv_reader = csv.reader(f, delimiter='|')
+		next(csv_reader)
+		for row in csv_reader:
+			yield row[4], row[2], row[0]
+
 ##
 # Represent a BGN GNIS geonames graph.
 #
@@ -140,8 +183,8 @@ class GeonamesGraph(StatsGraph):
 	##
 	#
 	#
-	def __init__(self):
-		super().__init__()
+	def __init__(self, sink=None):
+		super().__init__(sink)
 		self.g.bind('gnis-ont', self.ont_gnis)
 		self.g.bind('geo', self.ont_geo)
 
@@ -177,11 +220,13 @@ class GeonamesGraph(StatsGraph):
 		csv_reader = csv.reader(f, delimiter='|')
 		next(csv_reader)
 
+		n = 0
 		for n,row in enumerate(csv_reader, 1):
 			if n % 10000 == 0:
 				logging.debug("Processing {0}".format(n))
 
 			if row[2] not in {'Civil', 'Census', 'Populated Place'}:
+				metrics.skip('feature class')
 				continue
 
 			url = self.id_gnis[row[0]]
@@ -190,12 +235,12 @@ class GeonamesGraph(StatsGraph):
 			self.g.add((url, self.gnis_fid, rdflib.Literal(row[0], datatype=rdflib.XSD.string)))
 			self.g.add((url, rdflib.RDFS.label, rdflib.Literal(row[1]))) # XXX: In English?
 			self.g.add((url, self.gnis_name, rdflib.Literal(row[1], datatype=rdflib.XSD.string)))
-			self.g.add((url, self.gnis_cls, rdflib.Literal(row[2], datatype=rdflib.XSD.string)))
+			self.g.add((url, self.gnis_cls, self.terms.literal(row[2], rdflib.XSD.string)))
 
 			if len(row[3]):
 				self.g.add((url, self.gnis_fips55plc, rdflib.Literal(row[3], datatype=rdflib.XSD.string)))
 			if len(row[4]):
-				self.g.add((url, self.gnis_fips55cls, rdflib.Literal(row[4], datatype=rdflib.XSD.string)))
+				self.g.add((url, self.gnis_fips55cls, self.terms.literal(row[4], rdflib.XSD.string)))
 			if len(row[5]):
 				self.g.add((url, self.gnis_gsa, rdflib.Literal(row[5], datatype=rdflib.XSD.string)))
 			if len(row[6]):
@@ -205,16 +250,18 @@ class GeonamesGraph(StatsGraph):
 			# otherwise link to county.
 			if len(row[4]) and (row[4][0] == 'H' or row[4] == 'C7'):
 				state_gnis = m[(row[7], None)]
-				self.g.add((url, self.geo_within, self.id_gnis[state_gnis]))
-				self.g.add((url, self.gnis_fips6_4, rdflib.Literal(row[10], datatype=rdflib.XSD.string)))
+				self.g.add((url, self.geo_within, self.terms.uri(self.id_gnis, state_gnis)))
+				self.g.add((url, self.gnis_fips6_4, self.terms.literal(row[10], rdflib.XSD.string)))
 			else:
 				county_gnis = m[(row[7], row[10])]
-				self.g.add((url, self.geo_within, self.id_gnis[county_gnis]))
+				self.g.add((url, self.geo_within, self.terms.uri(self.id_gnis, county_gnis)))
 
 			# TODO: Get geometries from US Census Bureau.
 			#self.g.add((furl, self.geo_hasgeom, gurl))
 			#self.g.add((gurl, rdflib.RDF.type, self.geo_geom))
 			#self.g.add((gurl, self.geo_aswkt, rdflib.Literal('POINT ('+row[13]+' '+row[12]+')', datatype=self.geo_wkt)))
 
+		metrics.count('rows', n)
+
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,243 @@
+#!/usr/bin/python3 -u
+
+##
+# Input and output files: transparent compression, and finding the input
+# files of a batch.
+#
+
+import os
+import io
+import logging
+import functools
+import collections
+import concurrent.futures
+import fnmatch
+import tempfile
+import gzip
+import bz2
+import lzma
+import zipfile
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+##
+# The compressed file formats by filename extension, as functions to open
+# an input file and to compress a block into a complete compressed stream.
+# Concatenated streams are a valid file in each of these formats.
+#
+openers = {
+	'.gz': gzip.open,
+	'.bz2': bz2.open,
+	'.xz': lzma.open,
+}
+compressors = {
+	'.gz': functools.partial(gzip.compress, compresslevel=6, mtime=0),
+	'.bz2': bz2.compress,
+	'.xz': lzma.compress,
+}
+if zstandard:
+	openers['.zst'] = zstandard.open
+	compressors['.zst'] = lambda data: zstandard.ZstdCompressor().compress(data)
+
+##
+# Return whether a filename is of a compressed file, by its extension.
+#
+def compressed(fn):
+	ext = os.path.splitext(fn)[1]
+	return ext in openers or ext in {'.zip', '.zst'}
+
+##
+# Open an input file, decompressing it as a stream if its name ends in
+# .gz, .bz2, .xz or .zst. A .zip file must hold a single file.
+#
+# @input fn: The filename.
+# @input mode: 'rt' or 'rb'.
+# @return: A file object.
+#
+def open_input(fn, mode='rt'):
+	ext = os.path.splitext(fn)[1]
+	if ext == '.zip':
+		with zipfile.ZipFile(fn) as zipf:
+			names = [i.filename for i in zipf.infolist() if not i.is_dir()]
+			if len(names) != 1:
+				raise ValueError('Need a single file in {}, not {}'.format(fn, len(names)))
+			f = zipf.open(names[0])
+		return f if mode == 'rb' else io.TextIOWrapper(f)
+	elif ext in openers:
+		return openers[ext](fn, mode)
+	elif ext == '.zst':
+		raise ValueError('Need the zstandard module to read {}'.format(fn))
+	return open(fn, mode)
+
+##
+# Open an output file for writing bytes, compressing it if its name ends
+# in .gz, .bz2, .xz or .zst.
+#
+def open_output(fn):
+	ext = os.path.splitext(fn)[1]
+	if ext in compressors:
+		return BlockWriter(fn, compressors[ext])
+	elif ext == '.zst':
+		raise ValueError('Need the zstandard module to write {}'.format(fn))
+	return open(fn, 'wb')
+
+##
+# Return the name of a new empty file next to fn, to write and then move
+# over fn with os.replace(), so that processes writing fn at the same time
+# each have their own and fn is always whole.
+#
+def temp_name(fn):
+	fd,tmpfn = tempfile.mkstemp(dir=os.path.dirname(fn) or '.', prefix=os.path.basename(fn) + '.', suffix='.tmp')
+	os.close(fd)
+	return tmpfn
+
+##
+# A binary file writer that compresses blocks of output in parallel
+# threads, which the compressors allow by releasing the GIL. Each block
+# is compressed into its own stream, and the streams are written in order.
+#
+class BlockWriter:
+	##
+	# @input fn: The output filename.
+	# @input compress: A function compressing a block; see compressors.
+	# @input blocksize: The number of bytes per block.
+	# @input threads: The number of threads (default: the CPU count).
+	#
+	def __init__(self, fn, compress, blocksize=1<<20, threads=None):
+		self.f = open(fn, 'wb')
+		self.compress = compress
+		self.blocksize = blocksize
+		self.threads = threads or os.cpu_count()
+		self.pool = concurrent.futures.ThreadPoolExecutor(self.threads)
+		self.pending = collections.deque()
+		self.buf = []
+		self.size = 0
+
+	def write(self, data):
+		self.buf.append(data)
+		self.size += len(data)
+		if self.size >= self.blocksize:
+			self.submit()
+		return len(data)
+
+	##
+	# Start compressing the buffered data, then write out finished blocks,
+	# waiting if too many are queued.
+	#
+	def submit(self):
+		if self.buf:
+			self.pending.append(self.pool.submit(self.compress, b''.join(self.buf)))
+			self.buf = []
+			self.size = 0
+		while self.pending and (self.pending[0].done() or len(self.pending) > 2*self.threads):
+			self.f.write(self.pending.popleft().result())
+
+	##
+	# Write out the blocks compressed so far. Buffered data is kept to fill
+	# a block.
+	#
+	def flush(self):
+		while self.pending and self.pending[0].done():
+			self.f.write(self.pending.popleft().result())
+		self.f.flush()
+
+	def close(self):
+		if self.f.closed:
+			return
+		self.submit()
+		while self.pending:
+			self.f.write(self.pending.popleft().result())
+		self.pool.shutdown()
+		self.f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+##
+# Expand the directories in a list of input filenames into the files in
+# them that match pattern, in name order.
+#
+# @input fns: The input file and directory names.
+# @input pattern: A shell-style pattern for the names of files to take
+#                 from directories.
+# @return: The list of input filenames.
+#
+def input_files(fns, pattern='*'):
+	files = []
+	for fn in fns:
+		if os.path.isdir(fn):
+			files.extend(os.path.join(fn, name) for name in sorted(os.listdir(fn)) if fnmatch.fnmatch(name, pattern) and os.path.isfile(os.path.join(fn, name)))
+		else:
+			files.append(fn)
+	return files
+
+##
+# Return whether every line of the file afn after its header is also in
+# the file bfn, when both are sorted, e.g., a BLS data file for one state
+# and the one for all states. Finds the first line of afn in bfn with a
+# binary search, then merges, so it costs about a read of afn. Files that
+# are not sorted are taken as not subsets.
+#
+# @input afn: An uncompressed filename.
+# @input bfn: An uncompressed filename.
+#
+def sorted_subset(afn, bfn):
+	with open(afn, 'rb') as a, open(bfn, 'rb') as b:
+		a.readline()
+		first = a.readline().rstrip(b'\n')
+		if not first:
+			return True
+		b.readline()
+		start = b.tell()
+		lo,hi = start,os.path.getsize(bfn)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			b.seek(mid)
+			if mid > start:
+				b.readline()
+			line = b.readline()
+			if line and line.rstrip(b'\n') < first:
+				lo = mid + 1
+			else:
+				hi = mid
+		b.seek(lo)
+		if lo > start:
+			b.readline()
+
+		line = b.readline().rstrip(b'\n')
+		a.seek(0)
+		a.readline()
+		for aline in a:
+			aline = aline.rstrip(b'\n')
+			while line and line < aline:
+				line = b.readline().rstrip(b'\n')
+			if line != aline:
+				return False
+			line = b.readline().rstrip(b'\n')
+		return True
+
+##
+# Return the files that are not subsets of others, per sorted_subset(),
+# keeping the first of equal files. Compressed files are all kept.
+#
+# @input fns: The filenames.
+# @return: The list of filenames kept, in order.
+#
+def drop_subsets(fns):
+	sizes = [os.path.getsize(fn) for fn in fns]
+	kept = []
+	for i,a in enumerate(fns):
+		for j,b in enumerate(fns):
+			if i == j or compressed(a) or compressed(b) or sizes[j] < sizes[i] or (sizes[j] == sizes[i] and j > i):
+				continue
+			if sorted_subset(a, b):
+				logging.info("Skipping {}, a subset of {}".format(a, b))
+				break
+		else:
+			kept.append(a)
+	return kept
@@ -0,0 +1,69 @@
+#!/usr/bin/python3 -u
+
+##
+# Normalizing place names across naming schemes, for matching areas to
+# GNIS IDs.
+#
+
+import re
+import functools
+
+##
+# A normalizer of place names from one naming scheme to another, e.g.,
+# BLS area titles like "Lansing city, MI" to BGN names like "City of
+# Lansing", driven by a table of rules matched with one regular expression.
+# Results are memoized, as the same names recur across files.
+#
+class NameNormalizer:
+	##
+	# @input rules: A list of (separator, format, county) rules. At the first
+	#               separator found in a name, the text before it is put
+	#               in format; if county, the text after it up to
+	#               " County), " is the county. Rules listed first win
+	#               when separators start at the same place.
+	# @input replacements: A list of (old, new) substrings to replace
+	#                      first.
+	# @input maxsize: The maximum number of names memoized.
+	#
+	def __init__(self, rules, replacements=(), maxsize=65536):
+		self.rules = rules
+		self.replacements = replacements
+		self.regex = re.compile('|'.join('(?P<r{}>{})'.format(i, re.escape(sep)) for i,(sep,fmt,county) in enumerate(rules)))
+		self.normalize = functools.lru_cache(maxsize)(self.make_name)
+
+	##
+	# Return the normalized name and the county, or None.
+	#
+	def make_name(self, name):
+		for old,new in self.replacements:
+			name = name.replace(old, new)
+		m = self.regex.search(name)
+		if m is None:
+			return name, None
+		sep,fmt,county = self.rules[int(m.lastgroup[1:])]
+		county = name[m.end():].split(' County), ')[0] if county else None
+		return fmt.format(name[:m.start()]), county
+
+##
+# The rules from BLS area titles, as in <la.area>, to BGN names, as in the
+# NationalFedCodes file.
+#
+bls_place_rules = [
+	(' city, ', 'City of {}', False),
+	(' town, ', 'Town of {}', False),
+	(' town (', 'Town of {}', True),
+	(' village, ', 'Village of {}', False),
+	(' charter township, ', 'Charter Township of {}', False),
+	(' charter township (', 'Charter Township of {}', True),
+	(' township, ', 'Township of {}', False),
+	(' township (', 'Township of {}', True),
+	(' borough, ', 'Borough of {}', False),
+	(' municipality, ', 'Municipality of {}', False),
+	(' plantation, ', 'Plantation of {}', False),
+	(' unorganized, ', 'Unorganized Territory of {}', False),
+	(' gore, ', '{} Gore', False),
+	(' grant, ', '{} Grant', False),
+	(' location, ', '{} Location', False),
+]
+
+bls_places = NameNormalizer(bls_place_rules, [('St.', 'Saint')])
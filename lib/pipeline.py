@@ -0,0 +1,252 @@
+#!/usr/bin/python3 -u
+
+usage="""pipeline - run several converters from one process, sharing reference data
+
+Reads a config file declaring the datasets to convert, parses the shared
+reference files like GOVT_UNITS_*.txt once, then runs the converters
+concurrently in forked worker processes and reports per-dataset timing.
+
+The config file has a section per dataset, with the options
+
+	converter	one of geonames, cew, lau, oes, sf1 (default: the section name)
+	inputs		the converter input files, separated by whitespace
+	output		the output file
+	args		other converter options (default: -s)
+
+and a DEFAULT section for values shared by the others. For example:
+
+	[DEFAULT]
+	govunits = data/GOVT_UNITS_20170601.txt
+	natfed = data/NationalFedCodes_20170601.txt
+
+	[geonames]
+	inputs = ${govunits} ${natfed}
+	output = out/geonames.nt.gz
+	args = -s -f nt
+
+	[lau]
+	inputs = data/la.data.0.CurrentU data/la.area data/laucnty16.txt ${govunits} ${natfed}
+	output = out/lau.nt.gz
+	args = -s -f nt
+
+Usage:  pipeline [options] config.ini
+Arguments:
+
+	-j n		run at most n converters at a time (default: the CPU count)
+	-C dir		cache parsed reference files in dir
+	-m file		write a JSON report with metrics per dataset to file
+	-d			enable debugging
+"""
+
+import getopt
+import sys
+import os
+import logging
+import configparser
+import importlib.util
+import multiprocessing
+import multiprocessing.connection
+import shlex
+import time
+import json
+import traceback
+
+from stats import metrics
+from refcache import refcache
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+##
+# The converters by name: the script, relative to the repository root, its
+# reference inputs, as input position (negative from the end) => name of
+# the class in the script whose parse() reads that input, and the names of
+# those only to cache, not to load, with -C, as the converter caches what
+# it derives from them and only reads them on a miss. They are still
+# cached here, once before forking, rather than by each dataset at once.
+#
+converters = {
+	'geonames': ('geonames/geonames2rdf.py', {0: 'FIPS2GNISDict'}, set()),
+	'cew': ('bls-cew/cew2rdf.py', {-1: 'FIPS2GNISDict'}, set()),
+	'lau': ('bls-lau/lau2rdf.py', {-2: 'FIPS2GNISDict', -1: 'NameMap'}, {'NameMap'}),
+	'oes': ('bls-oes/oes2rdf.py', {2: 'FIPS2GNISDict'}, set()),
+	'sf1': ('census-sf1/sf1rdf.py', {}, set()),
+}
+
+##
+# Driver function. Read the config, load the converters and reference
+# data, run the datasets, write the report.
+#
+def main():
+	jobs = os.cpu_count()
+	reportfn = None
+	debuglvl = logging.INFO
+
+	logging.basicConfig(format='{levelname} {processName} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'hj:C:m:d')
+	except getopt.GetoptError as e:
+		logging.fatal('Getopt error {}'.format(e))
+		return 1
+
+	for opt, arg in opts:
+		if opt in {'-j', '--jobs'}:
+			jobs = int(arg)
+		elif opt in {'-C', '--cache'}:
+			refcache.enable(arg)
+		elif opt in {'-m', '--metrics'}:
+			reportfn = arg
+		elif opt in {'-d', '--debug'}:
+			debuglvl = logging.DEBUG
+		elif opt in {'-h', '--help'}:
+			print(usage, file=sys.stderr)
+			return 0
+		else:
+			logging.fatal('Invalid flag {}'.format(opt))
+			print(usage, file=sys.stderr)
+			return 1
+	if len(args) != 1:
+		logging.fatal('Need a config file')
+		print(usage, file=sys.stderr)
+		return 1
+
+	logging.getLogger().setLevel(debuglvl)
+
+	config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+	if not config.read(args[0]):
+		logging.fatal('Cannot read config file {}'.format(args[0]))
+		return 1
+	datasets = []
+	for name in config.sections():
+		section = config[name]
+		converter = section.get('converter', name)
+		if converter not in converters:
+			logging.fatal('Unknown converter {} for {}'.format(converter, name))
+			return 1
+		if 'inputs' not in section or 'output' not in section:
+			logging.fatal('Need inputs and output for {}'.format(name))
+			return 1
+		datasets.append(Dataset(name, converter, section['inputs'].split(), section['output'], shlex.split(section.get('args', '-s'))))
+
+	with metrics.stage("Loading converters"):
+		modules = {}
+		for dataset in datasets:
+			if dataset.converter not in modules:
+				modules[dataset.converter] = load(converters[dataset.converter][0])
+
+	with metrics.stage("Loading reference data"):
+		for dataset in datasets:
+			script,refs,cached = converters[dataset.converter]
+			for i,clsname in refs.items():
+				if not -len(dataset.inputs) <= i < len(dataset.inputs):
+					continue
+				parse = getattr(modules[dataset.converter], clsname).parse
+				if refcache.dn and clsname in cached:
+					refcache.table(dataset.inputs[i], parse)
+				else:
+					refcache.preload(dataset.inputs[i], parse)
+
+	with metrics.stage("Running datasets"):
+		results = run(datasets, modules, jobs)
+
+	failed = [name for name,result in results.items() if result['status'] != 0]
+	for dataset in datasets:
+		result = results[dataset.name]
+		logging.info("{}: status {}, {:.1f} s wall, {:.1f} s CPU".format(dataset.name, result['status'], result.get('wall', 0), result.get('cpu', 0)))
+	if failed:
+		logging.error("Failed: {}".format(' '.join(failed)))
+
+	if reportfn:
+		report = metrics.report()
+		report['datasets'] = results
+		with open(reportfn, 'w') as f:
+			json.dump(report, f, indent='\t')
+			f.write('\n')
+
+	return 1 if failed else 0
+
+##
+# A dataset to convert, from a config file section.
+#
+class Dataset:
+	def __init__(self, name, converter, inputs, output, args):
+		self.name = name
+		self.converter = converter
+		self.inputs = inputs
+		self.output = output
+		self.args = args
+
+##
+# Import a converter script as a module named for its file.
+#
+# @input script: The script, relative to the repository root.
+# @return: The module.
+#
+def load(script):
+	name = os.path.splitext(os.path.basename(script))[0]
+	if name in sys.modules:
+		return sys.modules[name]
+	spec = importlib.util.spec_from_file_location(name, os.path.join(root, script))
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
+
+##
+# Run the datasets in forked processes, at most jobs at a time. The
+# processes inherit the loaded modules and reference data, and are not
+# daemons, so converters may start their own workers with -j.
+#
+# @return: A dictionary of dataset name => result; see convert().
+#
+def run(datasets, modules, jobs):
+	ctx = multiprocessing.get_context('fork')
+	pending = list(datasets)
+	running = {}
+	results = {}
+	while pending or running:
+		while pending and len(running) < jobs:
+			dataset = pending.pop(0)
+			recv,send = ctx.Pipe(duplex=False)
+			proc = ctx.Process(target=convert, args=(dataset, modules[dataset.converter], send), name=dataset.name)
+			proc.start()
+			send.close()
+			running[recv] = (dataset, proc)
+			logging.info("Started {}".format(dataset.name))
+
+		# a result, or end of file if the process died
+		for recv in multiprocessing.connection.wait(list(running)):
+			dataset,proc = running.pop(recv)
+			try:
+				results[dataset.name] = recv.recv()
+			except EOFError:
+				results[dataset.name] = {'status': 1}
+			recv.close()
+			proc.join()
+			if proc.exitcode:
+				results[dataset.name]['status'] = proc.exitcode
+	return results
+
+##
+# Run a converter's main() on a dataset in a worker process, and send
+# back its status and metrics report.
+#
+def convert(dataset, module, conn):
+	script = converters[dataset.converter][0]
+	sys.argv = [script] + dataset.args + ['-o', dataset.output] + dataset.inputs
+	metrics.reset()
+	start = time.perf_counter()
+	try:
+		status = module.main() or 0
+	except Exception:
+		logging.error("{} failed: {}".format(dataset.name, traceback.format_exc()))
+		status = 1
+	metrics.write()
+	result = metrics.report()
+	result['status'] = status
+	result['wall'] = time.perf_counter() - start
+	conn.send(result)
+	conn.close()
+
+if __name__ == '__main__':
+	main()
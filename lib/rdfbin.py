@@ -0,0 +1,70 @@
+#!/usr/bin/python3 -u
+
+usage="""rdfbin - read the binary RDF format written by the converters with -f rdfbin
+
+Memory-maps the file and writes its triples as N-Triples, without parsing
+text. See BinarySink in stats.py for the layout.
+
+Usage:  rdfbin [options] file.rdfbin
+Arguments:
+
+	-o output	output N-Triples file (default: stdout)
+	-c			only print the term and triple counts
+	-d			enable debugging
+"""
+
+import getopt
+import sys
+import logging
+
+from stats import BinaryReader
+
+##
+# Driver function. Open the binary file, then dump or count its triples.
+#
+def main():
+	outf = sys.stdout.buffer
+	count = False
+	debuglvl = logging.INFO
+
+	logging.basicConfig(format='{levelname} {funcName}/l{lineno}: {message}', style='{', level=debuglvl)
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'ho:cd')
+	except getopt.GetoptError as e:
+		logging.fatal('Getopt error {}'.format(e))
+		return 1
+
+	for opt, arg in opts:
+		if opt in {'-o', '--output'}:
+			outf = arg
+		elif opt in {'-c', '--count'}:
+			count = True
+		elif opt in {'-d', '--debug'}:
+			debuglvl = logging.DEBUG
+		elif opt in {'-h', '--help'}:
+			print(usage, file=sys.stderr)
+			return 0
+		else:
+			logging.fatal('Invalid flag {}'.format(opt))
+			print(usage, file=sys.stderr)
+			return 1
+	if len(args) != 1:
+		logging.fatal('Need one input file')
+		print(usage, file=sys.stderr)
+		return 1
+
+	logging.getLogger().setLevel(debuglvl)
+
+	r = BinaryReader(args[0])
+	if count:
+		print('{} terms, {} triples'.format(r.nterms, len(r)))
+	elif isinstance(outf, str):
+		with open(outf, 'wb') as f:
+			r.dump(f)
+	else:
+		r.dump(outf)
+	r.close()
+
+if __name__ == '__main__':
+	main()
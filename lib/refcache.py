@@ -0,0 +1,205 @@
+#!/usr/bin/python3 -u
+
+##
+# A cache of parsed reference data files in memory-mapped tables.
+#
+
+import os
+import sys
+import logging
+import tempfile
+import shutil
+import struct
+import array
+import mmap
+import hashlib
+import types
+
+from fileio import open_input, temp_name
+
+##
+# A table of rows of strings in a memory-mappable file, for RefCache. The
+# layout, with little-endian integers, is:
+#
+#   header   8-byte magic, then uint64 row count N and uint64 offset of
+#            the data from the file start
+#   offsets  N+1 uint64 offsets of each row within the data, from byte 24
+#   data     each row as UTF-8, its fields separated by US (0x1f) and
+#            followed by RS (0x1e)
+#
+# A row can be read without reading the rest, and iterating decodes the
+# data in one go.
+#
+class RefTable:
+	magic = b'REFTBL\0\1'
+	header = struct.Struct('<8sQQ')
+
+	##
+	# Write rows to a new table file.
+	#
+	# @input fn: The table filename.
+	# @input rows: An iterable of tuples of strings.
+	#
+	@classmethod
+	def write(cls, fn, rows):
+		offsets = array.array('Q', [0])
+		with tempfile.TemporaryFile() as data:
+			for row in rows:
+				line = '\x1f'.join(row)
+				if line.count('\x1f') != len(row)-1 or '\x1e' in line:
+					raise ValueError('Separator in row {}'.format(row))
+				line = (line + '\x1e').encode()
+				data.write(line)
+				offsets.append(offsets[-1] + len(line))
+			if sys.byteorder != 'little':
+				offsets.byteswap()
+			with open(fn, 'wb') as f:
+				f.write(cls.header.pack(cls.magic, len(offsets)-1, cls.header.size + 8*len(offsets)))
+				f.write(offsets.tobytes())
+				data.seek(0)
+				shutil.copyfileobj(data, f, 1<<20)
+
+	def __init__(self, fn):
+		if sys.byteorder != 'little':
+			raise ValueError('Reading {} needs a little-endian host'.format(fn))
+		with open(fn, 'rb') as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic,self.nrows,self.datapos = self.header.unpack_from(self.mm)
+		if magic != self.magic:
+			raise ValueError('Not a reference table {}'.format(fn))
+		self.offsets = memoryview(self.mm)[self.header.size:self.datapos].cast('Q')
+
+	def __len__(self):
+		return self.nrows
+
+	def __getitem__(self, i):
+		row = self.mm[self.datapos+self.offsets[i]:self.datapos+self.offsets[i+1]-1]
+		return tuple(row.decode().split('\x1f'))
+
+	def __iter__(self):
+		data = self.mm[self.datapos:].decode()
+		for row in data.split('\x1e')[:-1]:
+			yield tuple(row.split('\x1f'))
+
+	def close(self):
+		self.offsets.release()
+		self.mm.close()
+
+##
+# A cache of the rows parsed from reference data files, like the BGN
+# "Government Units" file, so that later runs need not parse them again.
+# The rows are stored as a RefTable in the cache directory, named for the
+# parse function and keyed by hashes of the file's content and of the
+# function's code, so edited files and parsers miss the cache.
+#
+class RefCache:
+	def __init__(self):
+		self.dn = None
+		self.loaded = {}
+
+	##
+	# Cache in the directory dn, creating it if needed.
+	#
+	def enable(self, dn):
+		os.makedirs(dn, exist_ok=True)
+		self.dn = dn
+
+	##
+	# Return a hex digest of the contents of the file fn.
+	#
+	@staticmethod
+	def digest(fn):
+		h = hashlib.blake2b(digest_size=16)
+		with open(fn, 'rb') as f:
+			for block in iter(lambda: f.read(1<<20), b''):
+				h.update(block)
+		return h.hexdigest()
+
+	##
+	# Return a hex digest of the code of functions and classes, and of the
+	# repr() of other values, like tables of rules, so that cache files of
+	# what they compute miss when they are edited.
+	#
+	@classmethod
+	def code(cls, *objs):
+		h = hashlib.blake2b(digest_size=8)
+		for o in objs:
+			cls.hash_code(h, o)
+		return h.hexdigest()
+
+	@classmethod
+	def hash_code(cls, h, o):
+		o = getattr(o, '__func__', o)
+		o = getattr(o, '__code__', o)
+		if isinstance(o, type):
+			for name,v in sorted(vars(o).items()):
+				v = getattr(v, '__func__', v)
+				if hasattr(v, '__code__') or not name.startswith('_'):
+					cls.hash_code(h, v)
+		elif isinstance(o, types.CodeType):
+			h.update(o.co_code)
+			h.update(repr(o.co_names).encode())
+			for c in o.co_consts:
+				cls.hash_code(h, c)
+		elif isinstance(o, (set, frozenset)):
+			h.update(repr(sorted(o)).encode())
+		else:
+			h.update(repr(o).encode())
+
+	##
+	# Read the rows for the file fn once and keep them in memory for later
+	# rows() calls, e.g., by converters forked from this process.
+	#
+	def preload(self, fn, parse):
+		key = (os.path.realpath(fn), parse.__qualname__)
+		if key not in self.loaded:
+			self.loaded[key] = list(self.rows(fn, parse))
+
+	##
+	# Iterate over the rows that parse(f) yields for the file fn, reading
+	# them from memory or the cache if there, else parsing and caching them.
+	#
+	# @input fn: The reference data filename; see open_input().
+	# @input parse: A function from a text file to an iterable of tuples
+	#               of strings.
+	#
+	def rows(self, fn, parse):
+		key = (os.path.realpath(fn), parse.__qualname__)
+		if key in self.loaded:
+			yield from self.loaded[key]
+			return
+		if self.dn is None:
+			with open_input(fn) as f:
+				yield from parse(f)
+			return
+
+		cachefn = self.table(fn, parse)
+		logging.info("Loading {} from {}".format(fn, cachefn))
+		table = RefTable(cachefn)
+		yield from table
+		table.close()
+
+	##
+	# Return the name of the table of rows for the file fn in the cache,
+	# parsing the file and writing the table first if it is not there.
+	#
+	def table(self, fn, parse):
+		cachefn = os.path.join(self.dn, '{}-{}-{}.tbl'.format(parse.__qualname__, self.digest(fn), self.code(parse)))
+		if not os.path.exists(cachefn):
+			logging.info("Caching {} in {}".format(fn, cachefn))
+			tmpfn = temp_name(cachefn)
+			try:
+				with open_input(fn) as f:
+					RefTable.write(tmpfn, parse(f))
+				# another process may have cached it meanwhile, the same
+				if os.path.exists(cachefn):
+					os.remove(tmpfn)
+				else:
+					os.replace(tmpfn, cachefn)
+			except BaseException:
+				if os.path.exists(tmpfn):
+					os.remove(tmpfn)
+				raise
+		return cachefn
+
+refcache = RefCache()
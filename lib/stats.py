@@ -7,6 +7,156 @@
 import rdflib
 import rdflib.plugins.sleepycat
 import tempfile
+import re
+import functools
+import os
+import shutil
+import logging
+import multiprocessing
+import collections
+import contextlib
+import time
+import json
+import atexit
+import resource
+import sys
+import struct
+import array
+import mmap
+import hashlib
+import heapq
+import bisect
+
+from fileio import compressed, open_input, open_output
+
+##
+# Timings and counters for a conversion run: wall and CPU time per stage,
+# rows read, rows skipped by reason, triples emitted and bytes written.
+# Counting is always on; enable() writes them as a JSON report at exit.
+#
+class Metrics:
+	def __init__(self):
+		self.fn = None
+		self.reset()
+
+	##
+	# Clear the stages and counters, e.g., in a new worker process.
+	#
+	def reset(self):
+		self.stages = []
+		self.counts = collections.Counter()
+		self.skips = collections.Counter()
+		self.files = {}
+		self.start = time.perf_counter()
+
+	##
+	# Write the report to the file fn at exit.
+	#
+	def enable(self, fn):
+		self.fn = fn
+		atexit.register(self.write)
+
+	##
+	# Log the start of a stage and time it, for use in a with statement.
+	#
+	@contextlib.contextmanager
+	def stage(self, name):
+		logging.info(name)
+		wall,cpu = time.perf_counter(),self.cputime()
+		try:
+			yield
+		finally:
+			self.stages.append({'name': name, 'wall': time.perf_counter()-wall, 'cpu': self.cputime()-cpu})
+
+	def count(self, key, n=1):
+		self.counts[key] += n
+
+	def skip(self, reason, n=1):
+		self.skips[reason] += n
+
+	##
+	# Record the counters and wall time of one input file of a batch run,
+	# for the report.
+	#
+	def file(self, fn, counts, skips, wall):
+		self.files[fn] = {
+			'rows': counts['rows'],
+			'skipped': dict(skips),
+			'triples': counts['triples'],
+			'bytes': counts['bytes'],
+			'wall': wall,
+		}
+
+	##
+	# Add the counters from another process, e.g., a shard worker.
+	#
+	def merge(self, counts, skips):
+		self.counts.update(counts)
+		self.skips.update(skips)
+
+	##
+	# Return the CPU time of this process and its waited-for children.
+	#
+	@staticmethod
+	def cputime():
+		t = os.times()
+		return t.user + t.system + t.children_user + t.children_system
+
+	##
+	# Return the report as a dictionary.
+	#
+	def report(self):
+		report = {
+			'argv': sys.argv,
+			'stages': self.stages,
+			'rows': self.counts['rows'],
+			'skipped': dict(self.skips),
+			'triples': self.counts['triples'],
+			'duplicates': self.counts['duplicates'],
+			'bytes': self.counts['bytes'],
+			'wall': time.perf_counter()-self.start,
+			'cpu': self.cputime(),
+			'max_rss_kb': max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss),
+		}
+		if self.files:
+			report['files'] = self.files
+		return report
+
+	def write(self):
+		if self.fn is None:
+			return
+		with open(self.fn, 'w') as f:
+			json.dump(self.report(), f, indent='\t')
+			f.write('\n')
+
+metrics = Metrics()
+
+##
+# A factory for RDF terms, interning them in LRU-bounded tables so terms
+# that repeat across rows (industries, ownerships, years, areas) are only
+# constructed once.
+#
+class TermFactory:
+	##
+	# @input maxsize: The maximum number of terms kept per table.
+	#
+	def __init__(self, maxsize=65536):
+		self.uri = functools.lru_cache(maxsize)(self.make_uri)
+		self.literal = functools.lru_cache(maxsize)(self.make_literal)
+
+	##
+	# Return the URI for local name in namespace ns.
+	#
+	@staticmethod
+	def make_uri(ns, local):
+		return ns[local]
+
+	##
+	# Return the literal with the given value and datatype.
+	#
+	@staticmethod
+	def make_literal(value, datatype=None):
+		return rdflib.Literal(value, datatype=datatype)
 
 ##
 #
@@ -29,6 +179,8 @@ class StatsGraph:
 	sdmx_code = rdflib.Namespace("http://purl.org/linked-data/sdmx/2009/code#")
 	# TODO: use rdfs:subPropertyOf
 	qb_obs = qb['Observation']
+	qb_slice = qb['Slice']
+	qb_observation = qb['observation']
 	sdmx_area = sdmx_dimension['refArea']
 	sdmx_freq = sdmx_dimension['freq']
 	sdmx_time = sdmx_dimension['timePeriod']
@@ -40,9 +192,20 @@ class StatsGraph:
 	sdmx_cur = sdmx_measure['currency']
 	sdmx_adj = sdmx_attribute['adjustDetail']
 
-	def __init__(self):
-		with tempfile.TemporaryDirectory() as tmpdn:
-			self.g = rdflib.Graph(rdflib.plugins.sleepycat.Sleepycat(tmpdn))
+	##
+	# @input sink: Where triples go, e.g., a StreamSink. Anything with
+	#              the add(), bind() and serialize() methods of an
+	#              rdflib.Graph will do. Defaults to a Sleepycat-backed
+	#              rdflib.Graph.
+	#
+	def __init__(self, sink=None):
+		if sink is None:
+			with tempfile.TemporaryDirectory() as tmpdn:
+				sink = rdflib.Graph(rdflib.plugins.sleepycat.Sleepycat(tmpdn))
+		self.g = sink
+		self.terms = TermFactory()
+		self.checkpoint = None
+		self.lastslice = None
 		#self.g.bind('oes', self.id_oes)
 		#self.g.bind('gnis', self.id_gnis)
 		#self.g.bind('cbsa', self.id_cbsa)
@@ -55,10 +218,1295 @@ class StatsGraph:
 		self.g.bind('sdmx-measure', self.sdmx_measure)
 		self.g.bind('sdmx-attribute', self.sdmx_attribute)
 		self.g.bind('sdmx-code', self.sdmx_code)
+		self.sliceobs = self.template((self.qb_observation, Slot()))
+
+	##
+	#
+	#
+	def serialize(self, *args, **kwargs):
+		if isinstance(self.g, StreamSink):
+			self.g.serialize()
+			if self.g.dedup:
+				metrics.count('duplicates', self.g.dedup.dropped)
+			metrics.count('triples', len(self.g))
+			metrics.count('bytes', self.g.written)
+			return
+
+		metrics.count('triples', len(self.g))
+		if args and isinstance(args[0], str) and compressed(args[0]):
+			with open_output(args[0]) as f:
+				self.g.serialize(f, *args[1:], **kwargs)
+		else:
+			self.g.serialize(*args, **kwargs)
+		if args and isinstance(args[0], str):
+			metrics.count('bytes', os.path.getsize(args[0]))
+
+	##
+	# Save a checkpoint if one is due: write out the sink durably, then
+	# record how far the input has been converted. Call at the start of
+	# each row, before adding its triples; a resumed run starts from it.
+	#
+	# @input f: The LineReader being converted.
+	# @input rows: The number of rows the caller has converted before it.
+	#
+	def tick(self, f, rows):
+		if self.checkpoint is None or not self.checkpoint.due():
+			return
+		self.g.sync()
+		counts = collections.Counter(metrics.counts)
+		counts['rows'] += rows
+		self.checkpoint.save({
+			'input': os.path.abspath(f.fn),
+			'offset': f.lineoff,
+			'written': self.g.written,
+			'triples': len(self.g),
+			'counts': counts,
+			'skips': metrics.skips,
+		})
+
+	##
+	# Return an observation template for the sink. The pairs are
+	# (predicate, object), where an object may be a Slot to fill in for
+	# each observation. Call add(subject, *values) on the template with
+	# one value per slot, in order; a value of None leaves out its pair.
+	#
+	def template(self, *pairs):
+		if hasattr(self.g, 'template'):
+			return self.g.template(pairs)
+		return GraphTemplate(self.g, pairs)
+
+	##
+	# Return a template for a qb:Slice, like template(), with the pairs
+	# its observations share, e.g., their dimensions.
+	#
+	def slice_template(self, *pairs):
+		return self.template((rdflib.RDF.type, self.qb_slice), *pairs)
+
+	##
+	# Link the observation obs to the slice url, first adding the slice
+	# with its template and values, unless it was the last slice linked
+	# to. Inputs sorted by slice, as the BLS files are, then have each
+	# slice added once; otherwise its triples are repeated, which is
+	# harmless.
+	#
+	def slice(self, url, obs, template, *values):
+		if url != self.lastslice:
+			template.add(url, *values)
+			self.lastslice = url
+		self.sliceobs.add(url, obs)
+
+	##
+	# Convert the file fn in parallel. Split it into byte-range shards on
+	# line boundaries, convert each in a worker process with its own graph
+	# streaming to a temporary file, then concatenate the outputs in order.
+	# Only the first shard has the header line. Concatenated Turtle
+	# repeats the prefix declarations, which is allowed. For binary, sorted
+	# or delta output the shards are written as N-Triples and re-encoded by
+	# the parent.
+	#
+	# @input fn: The input filename.
+	# @input jobs: The number of worker processes and shards.
+	# @input outf: The output file object or filename.
+	# @input outfmt: The output format, one of stream_formats.
+	# @input method: The name of the conversion method, called with the
+	#                shard lines, then args, then the header keyword.
+	# @input args: The read-only lookup maps etc. for the method; each
+	#              worker gets its own copy.
+	# @input sink: A sink with add_line() to feed the N-Triples shard
+	#              outputs to, instead of concatenating them into outf.
+	# @input dedup: A memory budget in bytes for each worker to drop
+	#               repeated triples within its shard, or None.
+	#
+	@classmethod
+	def convert_sharded(cls, fn, jobs, outf, outfmt, method, *args, sink=None, dedup=None):
+		if sink is None and outfmt not in StreamSink.formats:
+			sink = stream_sink(outf, outfmt, dedup)
+		ranges = shards(fn, jobs)
+		shardfmt = 'nt' if sink is not None else outfmt
+		logging.info("Converting {} shards".format(len(ranges)))
+		with tempfile.TemporaryDirectory() as tmpdn:
+			tasks = [(fn, start, end, os.path.join(tmpdn, str(i)), shardfmt, dedup) for i,(start,end) in enumerate(ranges)]
+			with multiprocessing.Pool(jobs, shard_init, (cls, method, args)) as pool:
+				results = pool.map(shard_run, tasks, chunksize=1)
+			for outfn,counts,skips in results:
+				metrics.merge(counts, skips)
+
+			if sink is not None:
+				logging.info("Encoding shards")
+				for outfn,counts,skips in results:
+					with open(outfn) as f:
+						for line in f:
+							sink.add_line(line)
+				sink.serialize()
+				return
+
+			logging.info("Concatenating shards")
+			out = open_output(outf) if isinstance(outf, str) else outf
+			for outfn,counts,skips in results:
+				with open(outfn, 'rb') as f:
+					shutil.copyfileobj(f, out, 1<<20)
+			if out is outf:
+				out.flush()
+			else:
+				out.close()
+
+	##
+	# Convert many input files, each into its own output file, in at most
+	# jobs worker processes at a time. Each worker converts a whole file at
+	# a time with its own graph, as a single-file run would. The counters
+	# of all files are added up, and each file's are kept for the report.
+	#
+	# @input fns: The input filenames.
+	# @input outfns: The output filename for each input.
+	# @input jobs: The number of worker processes.
+	# @input outfmt: The output format.
+	# @input stream: Whether to stream to the outputs, in one of stream_formats.
+	# @input method: The name of the conversion method, called with the
+	#                opened input file, then args.
+	# @input args: The read-only lookup maps etc. for the method; each
+	#              worker gets its own copy.
+	# @input dedup: A memory budget in bytes for each output to drop
+	#               repeated streamed triples, or None.
+	#
+	@classmethod
+	def convert_batch(cls, fns, outfns, jobs, outfmt, stream, method, *args, dedup=None):
+		tasks = [(fn, outfn, outfmt, stream, dedup) for fn,outfn in zip(fns, outfns)]
+		logging.info("Converting {} files".format(len(tasks)))
+		with multiprocessing.Pool(jobs, shard_init, (cls, method, args)) as pool:
+			for fn,outfn,counts,skips,wall in pool.imap(batch_run, tasks):
+				logging.info("Converted {} to {}: {} rows, {} triples in {:.1f} s".format(fn, outfn, counts['rows'], counts['triples'], wall))
+				metrics.merge(counts, skips)
+				metrics.file(fn, counts, skips, wall)
+		logging.info("Converted {} files: {} rows, {} skipped, {} triples".format(len(tasks), metrics.counts['rows'], sum(metrics.skips.values()), metrics.counts['triples']))
+
+
+##
+# A placeholder in an observation template. Without a datatype it is
+# filled in with a term; with one, with the lexical value of a literal.
+#
+class Slot:
+	def __init__(self, datatype=None):
+		self.datatype = datatype
+
+##
+# An observation template that adds each triple to a graph or sink.
+#
+class GraphTemplate:
+	def __init__(self, g, pairs):
+		self.g = g
+		self.pairs = pairs
+
+	def add(self, s, *values):
+		values = iter(values)
+		for p,o in self.pairs:
+			if isinstance(o, Slot):
+				v = next(values)
+				if v is None:
+					continue
+				o = v if o.datatype is None else rdflib.Literal(v, datatype=o.datatype)
+			self.g.add((s,p,o))
+
+##
+# A triple sink backed by a Sleepycat store in a directory that outlives
+# the run. Triples are buffered in memory and written to the store a batch
+# at a time, each followed by a sync to disk. The store is not
+# transactional, so this saves the per-triple sync only: each triple is
+# still put into the store's indexes by itself, and a crash mid-batch
+# leaves part of it in the store. Opening an existing store appends to
+# it, so later runs add to the earlier data without reloading it, and
+# serialize() writes out everything in the store.
+#
+class StoreSink:
+	identifier = rdflib.URIRef(StatsGraph.prefix)
+
+	##
+	# @input path: The store directory, created if needed.
+	# @input batch: The number of triples to buffer per batch.
+	#
+	def __init__(self, path, batch=100000):
+		self.g = rdflib.Graph(rdflib.plugins.sleepycat.Sleepycat(), identifier=self.identifier)
+		self.g.open(path, create=True)
+		self.batch = batch
+		self.pending = []
+		self.triples = 0
+
+	def bind(self, prefix, namespace):
+		self.g.bind(prefix, namespace)
+
+	##
+	# Return the number of triples added in this run, without walking the
+	# store, which may also hold those of earlier runs.
+	#
+	def __len__(self):
+		return self.triples
+
+	def add(self, triple):
+		self.pending.append(triple)
+		self.triples += 1
+		if len(self.pending) >= self.batch:
+			self.flush()
 
 	##
+	# Write the buffered triples to the store and sync it.
 	#
+	def flush(self):
+		self.g.addN((s,p,o,self.g) for s,p,o in self.pending)
+		self.pending = []
+		self.g.store.sync()
+
+	##
+	# Flush, then serialize the whole store and close it.
 	#
 	def serialize(self, *args, **kwargs):
+		self.flush()
 		self.g.serialize(*args, **kwargs)
+		self.g.close()
+
+##
+# A triple sink that writes N-Triples or Turtle to the output as triples
+# are added, rather than collecting them in a store and serializing at the
+# end. Memory use is constant and each triple is only touched once.
+#
+# Consecutive triples with the same subject are written as one Turtle
+# subject block. Unlike a store, triples are not deduplicated, unless a
+# Dedup is given.
+#
+class StreamSink:
+	formats = {'nt', 'turtle'}
+	local_re = re.compile(r'[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?')
+	escapes = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+
+	##
+	# @input out: A binary file object or a filename.
+	# @input format: The output format, one of StreamSink.formats.
+	# @input dedup: A Dedup to drop repeated triples with, or None.
+	#
+	def __init__(self, out, format='turtle', dedup=None):
+		if format not in StreamSink.formats:
+			raise ValueError('Unsupported stream format {}'.format(format))
+		self.close_out = isinstance(out, str)
+		self.out = open_output(out) if self.close_out else out
+		self.format = format
+		self.ns = []
+		self.started = False
+		self.subject = None
+		self.pos = []
+		self.triples = 0
+		self.written = 0
+		self.dedup = dedup
+		# Turtle items of several objects folded by templates => their
+		# number of objects, as triples are counted by object
+		self.objects = {}
+		self.cterm = functools.lru_cache(65536)(self.term)
+		self.bind('rdf', rdflib.RDF)
+		self.bind('rdfs', rdflib.RDFS)
+		self.bind('xsd', rdflib.XSD)
+
+	##
+	# Bind a prefix to a namespace. Only used for Turtle output.
+	#
+	def bind(self, prefix, namespace):
+		self.ns = [(ns,p) for ns,p in self.ns if p != prefix]
+		self.ns.append((str(namespace), prefix))
+		self.ns.sort(key=lambda i: len(i[0]), reverse=True)
+		self.cterm.cache_clear()
+		if self.started and self.format == 'turtle':
+			self.flush()
+			self.write('@prefix {}: <{}> .\n'.format(prefix, namespace))
+
+	##
+	# Reopen the output of an interrupted run at a checkpoint, discarding
+	# anything written after it, to append the rest of the conversion.
+	#
+	# @input fn: The output filename.
+	# @input format: The output format, one of StreamSink.formats.
+	# @input state: The checkpoint state; see StatsGraph.tick().
+	# @input dedup: A Dedup, refilled with the triples written before the
+	#               checkpoint, so the run drops the same repeats as one
+	#               that was not interrupted.
+	#
+	@classmethod
+	def resume(cls, fn, format, state, dedup=None):
+		f = open(fn, 'r+b')
+		f.truncate(state['written'])
+		if dedup:
+			f.seek(0)
+			cls.refill(f, format, dedup)
+		f.seek(state['written'])
+		sink = cls(f, format, dedup)
+		sink.close_out = True
+		sink.written = state['written']
+		sink.triples = state['triples']
+		return sink
+
+	##
+	# Add the triples of an output written by a StreamSink to a Dedup, in
+	# the form unique() gives them: the subject and a rendered pair.
+	#
+	@staticmethod
+	def refill(f, format, dedup):
+		s = None
+		for line in f:
+			line = line.decode()
+			if format == 'nt':
+				dedup.add(line[:-3])
+			elif line.startswith('\t'):
+				dedup.add(s + ' ' + line[1:-3])
+			elif line.strip() and not line.startswith('@prefix'):
+				s,_,po = line.partition(' ')
+				dedup.add(s + ' ' + po[:-3])
+
+	def __len__(self):
+		return self.triples
+
+	##
+	# Add a triple, writing out the previous subject block if the subject
+	# changed.
+	#
+	def add(self, triple):
+		self.triples += 1
+		s,p,o = triple
+		if s != self.subject:
+			self.flush()
+			self.subject = s
+		if self.format == 'turtle' and p == rdflib.RDF.type:
+			self.pos.append('a ' + self.cterm(o))
+		else:
+			self.pos.append(self.cterm(p) + ' ' + self.term(o))
+
+	##
+	# Write out a whole subject block of rendered predicate-object pairs.
+	#
+	# @input n: The number of triples in the block (default: one per pair).
+	#
+	def block(self, s, pos, n=None):
+		self.flush()
+		self.triples += len(pos) if n is None else n
+		self.subject = s
+		self.pos = pos
+		self.flush()
+
+	##
+	# Return an observation template for this sink; see
+	# StatsGraph.template().
+	#
+	def template(self, pairs):
+		return StreamTemplate(self, pairs)
+
+	##
+	# Write out the current subject block.
+	#
+	def flush(self):
+		if not self.started:
+			self.started = True
+			if self.format == 'turtle' and not self.written:
+				for ns,prefix in sorted(self.ns, key=lambda i: i[1]):
+					self.write('@prefix {}: <{}> .\n'.format(prefix, ns))
+				self.write('\n')
+		if self.subject is None:
+			return
+		s = self.term(self.subject)
+		if self.dedup and not self.unique(s):
+			return
+		if self.format == 'turtle':
+			block = s + ' ' + ' ;\n\t'.join(self.pos) + ' .\n'
+		else:
+			block = ''.join(s + ' ' + po + ' .\n' for po in self.pos)
+		self.write(block)
+		self.subject = None
+		self.pos = []
+
+	##
+	# Drop the triples of the current subject block seen before. If none
+	# are left, drop the block and return False.
+	#
+	# @input s: The serialized subject.
+	#
+	def unique(self, s):
+		pos = []
+		for po in self.pos:
+			if self.dedup.add(s + ' ' + po):
+				pos.append(po)
+			else:
+				# a folded item stands for several triples
+				n = self.objects.get(po, 1)
+				self.triples -= n
+				self.dedup.dropped += n - 1
+		self.pos = pos
+		if not self.pos:
+			self.subject = None
+			return False
+		return True
+
+	##
+	# Write out everything added so far and wait for it to reach the disk.
+	#
+	def sync(self):
+		self.flush()
+		self.out.flush()
+		os.fsync(self.out.fileno())
+
+	def write(self, data):
+		data = data.encode()
+		self.written += len(data)
+		self.out.write(data)
+
+	##
+	# Return the serialization of an RDF term.
+	#
+	def term(self, t):
+		if isinstance(t, rdflib.Literal):
+			s = '"' + t.translate(self.escapes) + '"'
+			if t.language:
+				return s + '@' + t.language
+			elif t.datatype:
+				return s + '^^' + self.term(t.datatype)
+			return s
+		elif isinstance(t, rdflib.BNode):
+			return '_:' + str(t)
+		t = str(t)
+		if self.format == 'turtle':
+			for ns,prefix in self.ns:
+				if t.startswith(ns) and self.local_re.fullmatch(t, len(ns)):
+					return prefix + ':' + t[len(ns):]
+		return '<' + t + '>'
+
+	##
+	# Finish writing. Named to stand in for rdflib.Graph.serialize(), and
+	# so ignores its arguments, as the output was given at construction.
+	#
+	def serialize(self, *args, **kwargs):
+		self.flush()
+		if self.close_out:
+			self.out.close()
+		else:
+			self.out.flush()
+
+##
+# A filter of repeated triples for streaming sinks, within a memory
+# budget. It keeps the exact 64-bit hashes of the triples seen until they
+# would exceed the budget, then moves them into a Bloom filter of the
+# budget's size. From then on, a new triple is dropped with a probability
+# that grows with the number of triples; at 16 bits per triple it is
+# under 0.1%.
+#
+class Dedup:
+	entry = 64 # Approximate bytes per hash in a set.
+	k = 7 # Bloom filter bits set per triple.
+
+	##
+	# @input budget: The memory budget in bytes.
+	#
+	def __init__(self, budget):
+		self.budget = budget
+		self.seen = set()
+		self.bloom = None
+		self.dropped = 0
+
+	##
+	# Remember a serialized triple, and return whether it is new.
+	#
+	def add(self, t):
+		h = hash(t) & 0xffffffffffffffff
+		if self.bloom is None:
+			if h in self.seen:
+				self.dropped += 1
+				return False
+			self.seen.add(h)
+			if len(self.seen) * self.entry > self.budget:
+				self.spill()
+			return True
+		new = False
+		for i in self.bits(h):
+			if not self.bloom[i >> 3] & (1 << (i & 7)):
+				self.bloom[i >> 3] |= 1 << (i & 7)
+				new = True
+		if not new:
+			self.dropped += 1
+		return new
+
+	##
+	# Return the Bloom filter bit positions for a hash, by double hashing.
+	#
+	def bits(self, h):
+		m = len(self.bloom) * 8
+		h1,h2 = h & 0xffffffff, (h >> 32) | 1
+		return [(h1 + i*h2) % m for i in range(self.k)]
+
+	##
+	# Move the exact hashes into a Bloom filter.
+	#
+	def spill(self):
+		logging.warning("Over {} distinct triples, deduplicating with a Bloom filter".format(len(self.seen)))
+		self.bloom = bytearray(self.budget)
+		for h in self.seen:
+			for i in self.bits(h):
+				self.bloom[i >> 3] |= 1 << (i & 7)
+		self.seen = set()
+
+##
+# A triple sink writing a compact dictionary-encoded binary format, for
+# fast loading downstream. Each distinct term is stored once, and each
+# triple as three fixed-width term IDs. All integers are little-endian.
+#
+#   header     8-byte magic, then uint64 term count T, uint64 triple
+#              count N, uint64 offset of the term data and uint64
+#              offset of the triples, all offsets from the file start
+#   offsets    T+1 uint64 offsets of each term within the term data,
+#              starting at byte 40
+#   term data  the UTF-8 N-Triples serialization of each term, in ID
+#              order, padded to a multiple of 4 bytes
+#   triples    N triples of subject, predicate and object uint32 IDs
+#
+# Terms are numbered in order of first appearance. The term dictionary is
+# kept in memory; the term data and triple IDs are spooled to temporary
+# files until serialize() assembles the output. See BinaryReader.
+#
+class BinarySink(StreamSink):
+	formats = {'rdfbin'}
+	magic = b'RDFBIN\0\1'
+	header = struct.Struct('<8sQQQQ')
+
+	##
+	# @input out: A binary file object or a filename.
+	#
+	def __init__(self, out, dedup=None):
+		super().__init__(out, 'nt', dedup)
+		self.ids = {}
+		self.offsets = array.array('Q', [0])
+		self.data = tempfile.TemporaryFile()
+		self.triplef = tempfile.TemporaryFile()
+		self.buf = array.array('I')
+
+	##
+	# Return the ID of a serialized term, assigning one if new.
+	#
+	def id(self, t):
+		i = self.ids.get(t)
+		if i is None:
+			i = self.ids[t] = len(self.ids)
+			data = t.encode()
+			self.data.write(data)
+			self.offsets.append(self.offsets[-1] + len(data))
+		return i
+
+	##
+	# Encode the current subject block.
+	#
+	def flush(self):
+		self.started = True
+		if self.subject is None:
+			return
+		s = self.term(self.subject)
+		if self.dedup and not self.unique(s):
+			return
+		s = self.id(s)
+		for po in self.pos:
+			p,o = po.split(' ', 1)
+			self.buf.extend((s, self.id(p), self.id(o)))
+		if len(self.buf) >= 3<<16:
+			self.triplef.write(self.buf.tobytes())
+			self.buf = array.array('I')
+		self.subject = None
+		self.pos = []
+
+	##
+	# Add a triple given as an N-Triples line.
+	#
+	def add_line(self, line):
+		line = line.rstrip('\n')[:-2]
+		if self.dedup and not self.dedup.add(line):
+			return
+		s,p,o = line.split(' ', 2)
+		self.triples += 1
+		self.buf.extend((self.id(s), self.id(p), self.id(o)))
+
+	def serialize(self, *args, **kwargs):
+		self.flush()
+		self.triplef.write(self.buf.tobytes())
+		self.buf = array.array('I')
+		if sys.byteorder != 'little':
+			self.offsets.byteswap()
+		datapos = self.header.size + 8*len(self.offsets)
+		pad = -self.offsets[-1] % 4
+		triplepos = datapos + self.offsets[-1] + pad
+		self.out.write(self.header.pack(self.magic, len(self.ids), self.triples, datapos, triplepos))
+		self.out.write(self.offsets.tobytes())
+		for f in (self.data, self.triplef):
+			f.seek(0)
+			if f is self.triplef:
+				self.out.write(b'\0' * pad)
+			if sys.byteorder != 'little' and f is self.triplef:
+				for block in iter(lambda: f.read(3<<18), b''):
+					ids = array.array('I', block)
+					ids.byteswap()
+					self.out.write(ids.tobytes())
+			else:
+				shutil.copyfileobj(f, self.out, 1<<20)
+			f.close()
+		self.written = triplepos + 12*self.triples
+		self.ids = {}
+		if self.close_out:
+			self.out.close()
+		else:
+			self.out.flush()
+
+##
+# Byte lines sorted within a memory budget: they are buffered, then sorted
+# and spilled to a temporary file as a run when the buffer is full, and
+# the runs are merged when read back.
+#
+class SortedRuns:
+	budget = 256<<20
+	overhead = 64 # Approximate bytes per buffered line beyond its length.
+	fanin = 64 # The most runs merged at once.
+
+	##
+	# @input budget: The memory budget in bytes for buffering lines.
+	#
+	def __init__(self, budget=budget):
+		self.budget = budget
+		self.buf = []
+		self.size = 0
+		self.runs = []
+
+	def add(self, line):
+		self.buf.append(line)
+		self.size += len(line) + self.overhead
+		if self.size >= self.budget:
+			self.spill()
+
+	##
+	# Sort the buffered lines into a new run.
+	#
+	def spill(self):
+		self.buf.sort()
+		run = tempfile.TemporaryFile()
+		run.writelines(self.buf)
+		run.seek(0)
+		self.runs.append(run)
+		self.buf = []
+		self.size = 0
+		logging.debug("Spilled sorted run {}".format(len(self.runs)))
+
+	##
+	# Return an iterator over the sorted lines of the runs, merging them
+	# into fewer runs first if there are too many to open at once.
+	#
+	def merged(self):
+		while len(self.runs) > self.fanin:
+			runs,self.runs = self.runs[:self.fanin],self.runs[self.fanin:]
+			run = tempfile.TemporaryFile()
+			run.writelines(heapq.merge(*runs))
+			run.seek(0)
+			for f in runs:
+				f.close()
+			self.runs.append(run)
+		self.buf.sort()
+		return heapq.merge(self.buf, *self.runs)
+
+	def close(self):
+		for f in self.runs:
+			f.close()
+		self.runs = []
+		self.buf = []
+
+##
+# A triple sink for delta mode, writing only what changed since a previous
+# run. A manifest file lists each subject, e.g. an observation URI, with a
+# hash of its triples, sorted by subject. Triples are spooled to a
+# temporary file as N-Triples, and (subject, hash) records to sorted runs
+# on disk, as in SortedSink. At the end the runs are merged with the
+# manifest: the blocks of new and changed subjects are written to the
+# output, SPARQL Update deletes of changed and removed subjects to the
+# delete file, and the manifest is replaced. Only 64-bit hashes of the
+# changed subjects are kept in memory, so memory does not grow with the
+# number of subjects as a dictionary of them would.
+#
+# The hash of a subject is the sum of the hashes of its triples, so it
+# does not depend on triple order or on how its triples are split into
+# blocks. Blank node subjects are not supported.
+#
+class DeltaSink(StreamSink):
+	formats = {'nt'}
+	mask = (1<<64) - 1
+
+	##
+	# @input out: A binary file object or a filename, for the inserts.
+	# @input manifestfn: The manifest filename. It need not exist for the
+	#                    first run, which then writes everything.
+	# @input deletefn: The filename for the deletes.
+	# @input budget: The memory budget in bytes for buffering records.
+	#
+	def __init__(self, out, manifestfn, deletefn, dedup=None, budget=SortedRuns.budget):
+		super().__init__(tempfile.TemporaryFile(), 'nt', dedup)
+		self.dest = out
+		self.manifestfn = manifestfn
+		self.deletefn = deletefn
+		self.records = SortedRuns(budget)
+
+	##
+	# Return the hash of a serialized triple or term.
+	#
+	@staticmethod
+	def hash(line):
+		return int.from_bytes(hashlib.blake2b(line.encode(), digest_size=8).digest(), 'little')
+
+	##
+	# Spool the current subject block.
+	#
+	def flush(self):
+		self.started = True
+		if self.subject is None:
+			return
+		s = self.term(self.subject)
+		if self.dedup and not self.unique(s):
+			return
+		h = 0
+		for po in self.pos:
+			line = s + ' ' + po + ' .\n'
+			h += self.hash(line)
+			self.write(line)
+		self.records.add('{}\t{:016x}\n'.format(s, h & self.mask).encode())
+		self.subject = None
+		self.pos = []
+
+	##
+	# Add a triple given as an N-Triples line.
+	#
+	def add_line(self, line):
+		if self.dedup and not self.dedup.add(line.rstrip('\n')[:-2]):
+			return
+		s = line[:line.index(' ')]
+		self.records.add('{}\t{:016x}\n'.format(s, self.hash(line)).encode())
+		self.triples += 1
+		self.write(line)
+
+	##
+	# Iterate over (subject, hash) in subject order, from the records
+	# spooled in this run, summing the hashes of each subject.
+	#
+	def subjects(self):
+		last = None
+		h = 0
+		for line in self.records.merged():
+			s,_,x = line.rstrip(b'\n').rpartition(b'\t')
+			if s != last and last is not None:
+				yield last, h & self.mask
+				h = 0
+			last = s
+			h += int(x, 16)
+		if last is not None:
+			yield last, h & self.mask
+
+	##
+	# Iterate over (subject, hash) in subject order from a manifest.
+	#
+	@staticmethod
+	def read_manifest(fn):
+		if not os.path.exists(fn):
+			return
+		with open(fn, 'rb') as f:
+			for line in f:
+				h,s = line.rstrip(b'\n').split(b'\t', 1)
+				yield s, int(h, 16)
+
+	def serialize(self, *args, **kwargs):
+		self.flush()
+		# hashes of the subjects to write, and the counts of added,
+		# changed, removed and unchanged subjects
+		changed = array.array('Q')
+		counts = collections.Counter()
+		end = (None, None)
+		tmpfn = self.manifestfn + '.tmp'
+		with open(self.deletefn, 'w') as deletef, open(tmpfn, 'wb') as manifestf:
+			old = self.read_manifest(self.manifestfn)
+			new = self.subjects()
+			o = next(old, end)
+			n = next(new, end)
+			while o is not end or n is not end:
+				if n is end or (o is not end and o[0] < n[0]):
+					counts['removed'] += 1
+					deletef.write('DELETE WHERE {{ {} ?p ?o }} ;\n'.format(o[0].decode()))
+					o = next(old, end)
+					continue
+				manifestf.write(b'%016x\t%s\n' % (n[1], n[0]))
+				if o is end or n[0] < o[0]:
+					counts['added'] += 1
+					changed.append(self.hash(n[0].decode()))
+				elif n[1] != o[1]:
+					counts['changed'] += 1
+					changed.append(self.hash(n[0].decode()))
+					deletef.write('DELETE WHERE {{ {} ?p ?o }} ;\n'.format(n[0].decode()))
+					o = next(old, end)
+				else:
+					counts['unchanged'] += 1
+					o = next(old, end)
+				n = next(new, end)
+		self.records.close()
+		logging.info("Delta: {} added, {} changed, {} removed".format(counts['added'], counts['changed'], counts['removed']))
+
+		changed = array.array('Q', sorted(changed))
+		spool = self.out
+		spool.seek(0)
+		self.out = open_output(self.dest) if isinstance(self.dest, str) else self.dest
+		self.triples = self.written = 0
+		last = None
+		write = False
+		for line in spool:
+			line = line.decode()
+			s = line[:line.index(' ')]
+			if s != last:
+				last = s
+				h = self.hash(s)
+				i = bisect.bisect_left(changed, h)
+				write = not counts['unchanged'] or (i < len(changed) and changed[i] == h)
+			if write:
+				self.triples += 1
+				self.write(line)
+		spool.close()
+		if self.out is self.dest:
+			self.out.flush()
+		else:
+			self.out.close()
+		os.replace(tmpfn, self.manifestfn)
+
+##
+# A triple sink writing canonical N-Triples: the distinct triples sorted
+# by their UTF-8 bytes, as by "LC_ALL=C sort -u", so that runs over the same
+# input give identical output. Blank node labels are not canonicalized.
+#
+# Lines are buffered up to a memory budget in SortedRuns, which spills
+# them to temporary files as sorted runs; serialize() merges the runs.
+#
+class SortedSink(StreamSink):
+	formats = {'nt-sorted'}
+	budget = 256<<20
+
+	##
+	# @input out: A binary file object or a filename.
+	# @input budget: The memory budget in bytes for buffering lines.
+	#
+	def __init__(self, out, budget=budget):
+		super().__init__(out, 'nt')
+		self.lines = SortedRuns(budget)
+
+	def flush(self):
+		self.started = True
+		if self.subject is None:
+			return
+		s = self.term(self.subject)
+		for po in self.pos:
+			self.add_line(s + ' ' + po + ' .\n', False)
+		self.subject = None
+		self.pos = []
+
+	##
+	# Add a triple given as an N-Triples line.
+	#
+	def add_line(self, line, count=True):
+		self.lines.add(line.encode())
+		if count:
+			self.triples += 1
+
+	def serialize(self, *args, **kwargs):
+		self.flush()
+		self.triples = 0
+		last = None
+		for line in self.lines.merged():
+			if line != last:
+				self.out.write(line)
+				self.written += len(line)
+				self.triples += 1
+				last = line
+		self.lines.close()
+		if self.close_out:
+			self.out.close()
+		else:
+			self.out.flush()
+
+##
+# Read a file written by BinarySink through a memory map, without parsing
+# text. Iterating gives (subject, predicate, object) N-Triples term
+# strings; ids() gives the term IDs.
+#
+class BinaryReader:
+	def __init__(self, fn):
+		if sys.byteorder != 'little':
+			raise ValueError('Reading {} needs a little-endian host'.format(fn))
+		with open(fn, 'rb') as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic,self.nterms,self.ntriples,self.datapos,triplepos = BinarySink.header.unpack_from(self.mm)
+		if magic != BinarySink.magic:
+			raise ValueError('Not a binary RDF file {}'.format(fn))
+		view = memoryview(self.mm)
+		self.offsets = view[BinarySink.header.size:self.datapos].cast('Q')
+		self.triples = view[triplepos:triplepos+12*self.ntriples].cast('I')
+		self.term = functools.lru_cache(65536)(self.term)
+
+	def __len__(self):
+		return self.ntriples
+
+	##
+	# Return the N-Triples serialization of the term with ID i.
+	#
+	def term(self, i):
+		return self.mm[self.datapos+self.offsets[i]:self.datapos+self.offsets[i+1]].decode()
+
+	def ids(self):
+		t = self.triples
+		for k in range(0, len(t), 3):
+			yield t[k], t[k+1], t[k+2]
+
+	def __iter__(self):
+		term = self.term
+		for s,p,o in self.ids():
+			yield term(s), term(p), term(o)
+
+	##
+	# Write the triples to a binary file object as N-Triples.
+	#
+	def dump(self, out):
+		for s,p,o in self:
+			out.write((s + ' ' + p + ' ' + o + ' .\n').encode())
+
+	def close(self):
+		self.offsets.release()
+		self.triples.release()
+		self.mm.close()
+
+##
+# Return a streaming sink writing the format to out.
+#
+# @input dedup: A memory budget in bytes for dropping repeated triples,
+#               or None to keep them.
+#
+def stream_sink(out, format, dedup=None):
+	if format in SortedSink.formats:
+		return SortedSink(out, dedup or SortedSink.budget)
+	dedup = Dedup(dedup) if dedup else None
+	if format in BinarySink.formats:
+		return BinarySink(out, dedup)
+	return StreamSink(out, format, dedup)
+
+stream_formats = StreamSink.formats | BinarySink.formats | SortedSink.formats
+
+##
+# An observation template for a StreamSink. The constant pairs are rendered
+# once, with repeated predicates folded into Turtle object lists, so each
+# observation only renders its slots and is written as one subject block.
+#
+class StreamTemplate:
+	def __init__(self, sink, pairs):
+		self.sink = sink
+		self.items = []
+		# the number of triples beyond one per item, from folded objects
+		self.extra = 0
+		last = None
+		objects = 1
+		for p,o in pairs:
+			if sink.format == 'turtle' and p == rdflib.RDF.type:
+				ptxt = 'a '
+			else:
+				ptxt = sink.term(p) + ' '
+			if not isinstance(o, Slot) and sink.format == 'turtle' and p == last:
+				self.items[-1] += ', ' + sink.term(o)
+				self.extra += 1
+				objects += 1
+				sink.objects[self.items[-1]] = objects
+				continue
+			if not isinstance(o, Slot):
+				self.items.append(ptxt + sink.term(o))
+			elif o.datatype is None:
+				self.items.append((ptxt, None))
+			else:
+				self.items.append((ptxt + '"', '"^^' + sink.term(o.datatype)))
+			last = None if isinstance(o, Slot) else p
+			objects = 1
+
+	def add(self, s, *values):
+		pos = []
+		values = iter(values)
+		for item in self.items:
+			if item.__class__ is str:
+				pos.append(item)
+				continue
+			v = next(values)
+			if v is None:
+				continue
+			prefix,suffix = item
+			if suffix is None:
+				pos.append(prefix + self.sink.cterm(v))
+			else:
+				pos.append(prefix + v.translate(StreamSink.escapes) + suffix)
+		self.sink.block(s, pos, len(pos) + self.extra)
+
+##
+# Periodic checkpoints of a long conversion, so it can be resumed after a
+# crash. A checkpoint is a small JSON file of state recording how far the
+# conversion got, replaced atomically each time.
+#
+class Checkpoint:
+	##
+	# @input fn: The checkpoint filename.
+	# @input interval: The minimum number of seconds between checkpoints.
+	#
+	def __init__(self, fn, interval=60):
+		self.fn = fn
+		self.interval = interval
+		self.last = time.monotonic()
+
+	def due(self):
+		return time.monotonic() - self.last >= self.interval
+
+	def load(self):
+		with open(self.fn) as f:
+			return json.load(f)
+
+	##
+	# Return the saved state to resume converting fn from, or None to start
+	# from the beginning when there is no checkpoint yet, as on the first
+	# run of a restartable job.
+	#
+	# @input fn: The input filename.
+	# @return: The state; see StatsGraph.tick().
+	#
+	def resume(self, fn):
+		if not os.path.exists(self.fn):
+			logging.info("No checkpoint {}, starting from the beginning".format(self.fn))
+			return None
+		state = self.load()
+		if os.path.abspath(state['input']) != os.path.abspath(fn):
+			raise ValueError('Checkpoint {} is for {}, not {}'.format(self.fn, state['input'], fn))
+		# offsets into compressed inputs are of the decompressed data
+		if not compressed(fn) and os.path.getsize(fn) < state['offset']:
+			raise ValueError('Checkpoint {} is at byte {}, past the end of {}'.format(self.fn, state['offset'], fn))
+		return state
+
+	def save(self, state):
+		tmpfn = self.fn + '.tmp'
+		with open(tmpfn, 'w') as f:
+			json.dump(state, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmpfn, self.fn)
+		self.last = time.monotonic()
+		logging.debug("Saved checkpoint {}".format(self.fn))
+
+	##
+	# Remove the checkpoint once the conversion has finished.
+	#
+	def remove(self):
+		if os.path.exists(self.fn):
+			os.remove(self.fn)
+
+##
+# Iterate over the decoded lines in a byte range of a file. The offset
+# attribute is the byte position following the last line returned, and
+# lineoff the position of that line.
+#
+class LineReader:
+	##
+	# @input fn: The filename.
+	# @input start: The byte offset of the first line.
+	# @input end: The byte offset to stop at, or None for end of file.
+	#
+	def __init__(self, fn, start=0, end=None, encoding='utf-8'):
+		self.fn = fn
+		self.offset = start
+		self.lineoff = start
+		self.end = end
+		self.encoding = encoding
+
+	def __iter__(self):
+		with open_input(self.fn, 'rb') as f:
+			f.seek(self.offset)
+			for line in f:
+				if self.end is not None and self.offset >= self.end:
+					break
+				self.lineoff = self.offset
+				self.offset += len(line)
+				yield line.decode(self.encoding)
+
+##
+# A selection of the rows of a delimited input, tested on each raw line
+# before it is parsed, so an unwanted row only costs splitting off its
+# first few fields. A test is on a field, stripped of spaces and quotes,
+# or a fixed-width slice of it, like the area code in a series ID. A row
+# is kept if it passes all the tests; dropped rows are counted as read,
+# and as skipped with reason 'filter'.
+#
+class LineFilter:
+	##
+	# @input sep: The field separator.
+	#
+	def __init__(self, sep):
+		self.sep = sep
+		self.tests = []
+		self.nfields = 0
+
+	def __bool__(self):
+		return bool(self.tests)
+
+	##
+	# Keep rows whose field i, or its slice [start:end], starts with one
+	# of prefixes.
+	#
+	def prefix(self, i, prefixes, start=0, end=None):
+		self.add(i, start, end, 'prefix', tuple(prefixes))
+
+	##
+	# Keep rows whose field i, or its slice [start:end], is one of values.
+	#
+	def values(self, i, values, start=0, end=None):
+		self.add(i, start, end, 'values', frozenset(values))
+
+	##
+	# Keep rows whose field i, or its slice [start:end], is between low
+	# and high inclusive, comparing as strings, e.g., years. A high of
+	# None is unbounded.
+	#
+	def range(self, i, low, high, start=0, end=None):
+		self.add(i, start, end, 'range', (low, high))
+
+	##
+	# Keep rows whose field i, or its slice [start:end], is in a range
+	# given as text: a value, or low-high where either bound may be left
+	# out, e.g., 2010 for 2010 only or 2010- for 2010 on. Raises ValueError
+	# for other text.
+	#
+	def span(self, i, text, start=0, end=None):
+		low,sep,high = text.partition('-')
+		if not (low or high) or '-' in high:
+			raise ValueError('Invalid range {}'.format(text))
+		self.range(i, low, (high or None) if sep else low, start, end)
+
+	def add(self, i, start, end, kind, arg):
+		self.tests.append((i, start, end, kind, arg))
+		self.nfields = max(self.nfields, i+1)
+
+	##
+	# Yield the lines that pass the tests.
+	#
+	def __call__(self, lines):
+		sep,n,tests = self.sep,self.nfields,self.tests
+		dropped = 0
+		for line in lines:
+			fields = line.split(sep, n)
+			for i,start,end,kind,arg in tests:
+				v = fields[i].strip(' "')[start:end] if i < len(fields) else ''
+				if kind == 'prefix':
+					ok = v.startswith(arg)
+				elif kind == 'values':
+					ok = v in arg
+				else:
+					ok = arg[0] <= v and (arg[1] is None or v <= arg[1])
+				if not ok:
+					dropped += 1
+					break
+			else:
+				# count before yielding, so a checkpoint of the row sees them
+				if dropped:
+					metrics.count('rows', dropped)
+					metrics.skip('filter', dropped)
+					dropped = 0
+				yield line
+		if dropped:
+			metrics.count('rows', dropped)
+			metrics.skip('filter', dropped)
 
+##
+# Split a file into at most n byte ranges, each starting at a line.
+#
+# @input fn: The filename.
+# @input n: The number of ranges wanted.
+# @return: A list of (start, end) byte offsets.
+#
+def shards(fn, n):
+	if compressed(fn):
+		logging.warning("Cannot split compressed {}, converting it in one process".format(fn))
+		return [(0, None)]
+	size = os.path.getsize(fn)
+	bounds = [0]
+	with open(fn, 'rb') as f:
+		for i in range(1, n):
+			off = size * i // n
+			if off <= bounds[-1]:
+				continue
+			f.seek(off - 1)
+			f.readline()
+			if f.tell() < size:
+				bounds.append(f.tell())
+	bounds.append(size)
+	return [(start,end) for start,end in zip(bounds, bounds[1:]) if start < end]
+
+##
+# Set up a worker process for StatsGraph.convert_sharded().
+#
+def shard_init(cls, method, args):
+	global shard_job
+	shard_job = (cls, method, args)
+
+##
+# Convert one shard in a worker process. Return the output filename and
+# the shard's metrics counters.
+#
+def shard_run(task):
+	fn, start, end, outfn, outfmt, dedup = task
+	cls, method, args = shard_job
+	metrics.reset()
+	g = cls(StreamSink(outfn, outfmt, Dedup(dedup) if dedup else None))
+	getattr(g, method)(LineReader(fn, start, end), *args, header=start == 0)
+	g.serialize()
+	return outfn, metrics.counts, metrics.skips
+
+##
+# Convert one file of a batch in a worker process. Return the filenames,
+# the file's metrics counters and its wall time.
+#
+def batch_run(task):
+	fn, outfn, outfmt, stream, dedup = task
+	cls, method, args = shard_job
+	metrics.reset()
+	g = cls(stream_sink(outfn, outfmt, dedup) if stream else None)
+	with open_input(fn) as f:
+		getattr(g, method)(f, *args)
+	g.serialize(outfn, format=outfmt)
+	return fn, outfn, metrics.counts, metrics.skips, time.perf_counter()-metrics.start
+
+# filename extensions of the output formats
+extensions = {
+	'turtle': '.ttl',
+	'nt': '.nt',
+	'nt-sorted': '.nt',
+	'rdfbin': '.rdfbin',
+	'xml': '.rdf',
+	'n3': '.n3',
+	'json-ld': '.jsonld',
+}
+
+##
+# Return the name of the output file in directory outdn for the input fn
+# of a batch: the input's name without its .csv, .txt and compression
+# extensions, with the extension of the output format.
+#
+def output_file(fn, outdn, outfmt):
+	name = os.path.basename(fn)
+	while compressed(name) or os.path.splitext(name)[1] in {'.csv', '.txt'}:
+		name = os.path.splitext(name)[0]
+	return os.path.join(outdn, name + extensions.get(outfmt, '.' + outfmt))
+
+##
+# Return the names of the output files in directory outdn for the inputs
+# fns of a batch, as output_file() does. Raise ValueError if two inputs,
+# e.g., of the same name in different directories, would be written to
+# the same output file.
+#
+def output_files(fns, outdn, outfmt):
+	outfns = {}
+	for fn in fns:
+		outfn = output_file(fn, outdn, outfmt)
+		if outfn in outfns:
+			raise ValueError('{} and {} would both be written to {}'.format(outfns[outfn], fn, outfn))
+		outfns[outfn] = fn
+	return list(outfns)
@@ -21,6 +21,9 @@ Arguments:
 	file			Cornell XML tarfile
  	-d, --debug		enable debuging output (twice for verbose)
 	-l, --load-dtd		enable loading of DTD
+	-c, --checkpoint file	record finished titles in file
+				(default: usc-checkpoint.json)
+	-r, --resume		skip the titles recorded in the checkpoint file
 	-h			display this help and exit
 """
 
@@ -35,6 +38,8 @@ import itertools
 import urllib.request
 import tempfile
 import logging
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+from stats import Checkpoint
 try:
 	import lxml.etree as etree
 except ImportError:
@@ -68,7 +73,7 @@ P_S_TITLE = LOC['hasCodeSectionTitle']
 P_S_STATUS = LOC['hasCodeSectionStatus']
 P_S_PARA = LOC['hasCodeParagraph']
 
-flags = {'dtd': False}
+flags = {'dtd': False, 'checkpoint': 'usc-checkpoint.json', 'resume': False}
 
 ##
 # Entry function. Parse paramters, call main function.
@@ -79,7 +84,7 @@ def main():
 
 	# parse commandline for flags and arguments
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'hdl')
+		opts, args = getopt.getopt(sys.argv[1:], 'hdlc:r', ['help', 'debug', 'load-dtd', 'checkpoint=', 'resume'])
 	except getopt.GetoptError:
 		logging.fatal('getopt error %s', usage)
 		sys.exit(1)
@@ -97,6 +102,10 @@ def main():
 				logging.getLogger().setLevel(logging.DEBUG)
 		elif opt in {'-l', '--load-dtd'}:
 			flags['dtd'] = True
+		elif opt in {'-c', '--checkpoint'}:
+			flags['checkpoint'] = arg
+		elif opt in {'-r', '--resume'}:
+			flags['resume'] = True
 		else:
 			logging.fatal('invalid flag %s %s', opt, usage)
 			sys.exit(1)
@@ -106,14 +115,24 @@ def main():
 		logging.fatal('need directory %s', usage)
 		sys.exit(1)
 
+	# the number of titles finished for each tarfile
+	checkpoint = Checkpoint(flags['checkpoint'], 0)
+	done = {}
+	if flags['resume'] and os.path.exists(checkpoint.fn):
+		done = checkpoint.load()
+
 	for fn in args:
 		with tarfile.open(fn) as tf:
-			do_it(tf)
+			do_it(tf, fn, done, checkpoint)
+
+	checkpoint.remove()
 
 ##
+# Convert each title in a tarfile to its own Turtle file. A title's file
+# is written durably before the title is recorded as done in the
+# checkpoint, and titles already done are skipped.
 #
-#
-def do_it(tf):
+def do_it(tf, tfn, done, checkpoint):
 	# locate the TOC file
 	fn = next(f for f in tf.getnames() if re.match('.*TOC\.XML$', f))
 	d = os.path.dirname(fn)
@@ -122,7 +141,10 @@ def do_it(tf):
 	r = parse_xml(tf.extractfile(fn)).getroot()
 
 	enum = None
-	for el in r.findall('supsec'):
+	for i,el in enumerate(r.findall('supsec')):
+		if i < done.get(tfn, 0):
+			logging.info('skipping done title %s of %s', i, tfn)
+			continue
 		g = rdflib.graph.Graph()
 		g.bind('loc', LOC_URL)
 		for tup in parse_toc_xml_gen(tf, d, el, '0', None):
@@ -135,7 +157,12 @@ def do_it(tf):
 				logging.debug('got tup')
 		fn = enum + 'usc.ttl'
 		logging.debug('writing %s', fn)
-		g.serialize(fn, 'turtle')
+		g.serialize(fn + '.tmp', 'turtle')
+		with open(fn + '.tmp', 'rb') as f:
+			os.fsync(f.fileno())
+		os.replace(fn + '.tmp', fn)
+		done[tfn] = i+1
+		checkpoint.save(done)
 
 ##
 # Parse an XML file and return XML object, handling errors